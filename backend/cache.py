@@ -0,0 +1,97 @@
+"""
+Small in-process caches for slow-changing API payloads.
+
+CachedResource keeps one value for `ttl` seconds together with an ETag and a
+Last-Modified timestamp, so endpoints can answer conditional requests with
+304 Not Modified without recomputing anything.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import Request
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    value: Any
+    etag: str
+    last_modified: datetime
+    fetched_at: float
+
+    @property
+    def last_modified_header(self) -> str:
+        return format_datetime(self.last_modified.astimezone(timezone.utc), usegmt=True)
+
+
+def make_etag(value: Any) -> str:
+    payload = json.dumps(value, sort_keys=True, default=str).encode("utf-8")
+    return '"' + hashlib.sha1(payload).hexdigest()[:16] + '"'
+
+
+def is_not_modified(request: Request, entry: CacheEntry) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since against a cache entry"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return "*" in tags or entry.etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return entry.last_modified.replace(microsecond=0) <= since
+    return False
+
+
+class CachedResource:
+    """
+    A single value refreshed at most once per `ttl` seconds.
+    `loader` is a blocking callable returning (value, last_modified); it runs in
+    the threadpool, and concurrent callers share one refresh. If a refresh
+    fails while an older value exists, the older value keeps being served.
+    """
+
+    def __init__(self, loader: Callable[[], Any], ttl: float = 60.0):
+        self.loader = loader
+        self.ttl = ttl
+        self._entry: Optional[CacheEntry] = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._entry is not None and time.monotonic() - self._entry.fetched_at < self.ttl
+
+    async def get(self) -> CacheEntry:
+        if self._fresh():
+            return self._entry
+
+        async with self._lock:
+            if self._fresh():
+                return self._entry
+            try:
+                value, last_modified = await run_in_threadpool(self.loader)
+            except Exception:
+                if self._entry is None:
+                    raise
+                print("⚠️ Cache refresh failed, serving stale value")
+                return self._entry
+
+            if self._entry is not None and self._entry.etag == make_etag(value):
+                # Unchanged payload: keep validators stable, just extend freshness
+                self._entry = CacheEntry(value, self._entry.etag, self._entry.last_modified, time.monotonic())
+            else:
+                self._entry = CacheEntry(value, make_etag(value), last_modified or datetime.now(timezone.utc), time.monotonic())
+            return self._entry
+
+    def invalidate(self):
+        self._entry = None
@@ -0,0 +1,71 @@
+"""
+Shared Supabase client.
+
+One client is created for the whole app (opened in the FastAPI lifespan) on
+top of a pooled keep-alive httpx transport, instead of calling create_client()
+for every request and tool call. Routers get it through `get_supabase`.
+"""
+import os
+import threading
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+from supabase import create_client, Client, ClientOptions
+
+POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", "20"))
+POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", "10"))
+POOL_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY", "60"))
+REQUEST_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
+_client: Optional[Client] = None
+_http_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+
+def _build_http_client() -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+        ),
+        timeout=REQUEST_TIMEOUT,
+        http2=True,
+    )
+
+
+def init_supabase() -> Optional[Client]:
+    """Create the shared client if credentials are configured (idempotent)"""
+    global _client, _http_client
+    with _lock:
+        if _client is not None:
+            return _client
+
+        url = os.getenv("SUPABASE_URL")
+        key = os.getenv("SUPABASE_KEY")
+        if not url or not key:
+            return None
+
+        # httpx_client injection needs supabase-py >= 2.25 (pinned in requirements)
+        http_client = _build_http_client()
+        client = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+
+        _client, _http_client = client, http_client
+        return _client
+
+
+def close_supabase():
+    """Release pooled connections (called on app shutdown)"""
+    global _client, _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _client, _http_client = None, None
+
+
+def get_supabase() -> Client:
+    client = _client or init_supabase()
+    if client is None:
+        raise HTTPException(status_code=500, detail="Supabase credentials not configured")
+    return client
@@ -0,0 +1,145 @@
+"""
+Two-tier cache for query embeddings.
+
+Keys are a SHA-256 of (model, task type, normalized text). Lookups go to an
+in-process LRU first, then to a local SQLite file holding float32 vectors,
+and only then to the embedding API. The SQLite tier is LRU-trimmed to
+`max_entries` rows by last use, so repeated queries survive restarts without
+growing the file forever.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+try:
+    from backend.response_cache import normalize_query
+except ImportError:
+    from response_cache import normalize_query
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite3")
+
+# Trim the SQLite tier every N inserts rather than on every write
+TRIM_EVERY = 100
+
+
+def embedding_key(text: str, model: str, task_type: Optional[str]) -> str:
+    raw = f"{model}\x00{task_type or ''}\x00{normalize_query(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, max_entries: int = 10000, memory_entries: int = 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._inserts = 0
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if path:
+            self._open()
+
+    def _open(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("""
+                create table if not exists embeddings (
+                  key text primary key,
+                  model text not null,
+                  dims integer not null,
+                  vector blob not null,
+                  last_used real not null
+                )
+            """)
+            conn.execute("create index if not exists embeddings_last_used on embeddings (last_used)")
+            conn.commit()
+            self._conn = conn
+        except sqlite3.Error as e:
+            # Degrade to memory-only rather than failing requests
+            print(f"⚠️ Embedding cache disabled on disk ({self.path}): {e}")
+            self._conn = None
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _load(self, key: str) -> Optional[np.ndarray]:
+        if self._conn is None:
+            return None
+        row = self._conn.execute("select dims, vector from embeddings where key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("update embeddings set last_used = ? where key = ?", (time.time(), key))
+        self._conn.commit()
+        dims, blob = row
+        return np.frombuffer(blob, dtype=np.float32, count=dims)
+
+    def _save(self, key: str, model: str, vector: np.ndarray):
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "insert or replace into embeddings (key, model, dims, vector, last_used) values (?, ?, ?, ?, ?)",
+            (key, model, int(vector.shape[0]), vector.tobytes(), time.time()),
+        )
+        self._inserts += 1
+        if self._inserts % TRIM_EVERY == 0:
+            self._conn.execute(
+                "delete from embeddings where key in ("
+                " select key from embeddings order by last_used desc limit -1 offset ?)",
+                (self.max_entries,),
+            )
+        self._conn.commit()
+
+    def get_or_embed(self, text: str, model: str, task_type: Optional[str],
+                     embed: Callable[[str], Any]) -> np.ndarray:
+        """Cached float32 embedding for text; calls `embed(text)` only on a full miss"""
+        key = embedding_key(text, model, task_type)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return vector
+            try:
+                vector = self._load(key)
+            except sqlite3.Error as e:
+                print(f"Embedding cache read failed: {e}")
+                vector = None
+            if vector is not None:
+                self._remember(key, vector)
+                self._stats["disk_hits"] += 1
+                return vector
+            self._stats["misses"] += 1
+
+        # Network call outside the lock
+        vector = np.asarray(embed(text), dtype=np.float32)
+
+        with self._lock:
+            self._remember(key, vector)
+            try:
+                self._save(key, model, vector)
+            except sqlite3.Error as e:
+                print(f"Embedding cache write failed: {e}")
+        return vector
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"memory_entries": len(self._memory), "path": self.path, **self._stats}
+
+
+embedding_cache = EmbeddingCache(
+    path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH) or None,
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    memory_entries=int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "1024")),
+)
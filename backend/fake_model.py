@@ -0,0 +1,105 @@
+"""
+Local stand-in for google.generativeai.GenerativeModel.
+
+Enabled with CHAT_MODEL_BACKEND=fake so the chat endpoints (including the
+SSE stream) can be exercised without a Gemini key or network access. It
+mimics the small part of the SDK the routers use: start_chat(), and
+send_message() with or without stream=True. Responses carry .parts with
+.text / .function_call.
+"""
+import hashlib
+import os
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+ZIP_PATTERN = re.compile(r"\b(20\d{3})\b")
+
+# Delay between streamed chunks, to make time-to-first-token visible
+CHUNK_DELAY = float(os.getenv("FAKE_MODEL_CHUNK_DELAY", "0.05"))
+
+
+def _text_part(text: str):
+    return SimpleNamespace(text=text, function_call=None)
+
+
+def _call_part(name: str, args: Dict[str, Any]):
+    return SimpleNamespace(text="", function_call=SimpleNamespace(name=name, args=args))
+
+
+class FakeResponse:
+    def __init__(self, parts: List[SimpleNamespace], stream: bool):
+        self._parts = parts
+        self._stream = stream
+
+    @property
+    def parts(self):
+        return self._parts
+
+    @property
+    def text(self) -> str:
+        return "".join(p.text for p in self._parts)
+
+    def __iter__(self):
+        for part in self._parts:
+            if self._stream:
+                time.sleep(CHUNK_DELAY)
+            yield SimpleNamespace(parts=[part], text=part.text)
+
+
+class FakeChatSession:
+    def __init__(self, model: "FakeGenerativeModel", history, enable_automatic_function_calling: bool):
+        self.model = model
+        self.history = list(history or [])
+        self.auto_call = enable_automatic_function_calling
+
+    def _answer(self, tool_name: Optional[str], result: Any) -> List[SimpleNamespace]:
+        words = f"[{self.model.model_name}] "
+        if tool_name:
+            summary = ", ".join(sorted(result.keys())) if hasattr(result, "keys") else str(result)
+            words += f"Based on {tool_name} ({summary}), here is a short analysis."
+        else:
+            words += "This is a fake answer generated locally without calling Gemini."
+        return [_text_part(w + " ") for w in words.split(" ") if w]
+
+    def send_message(self, content, stream: bool = False):
+        # Function responses coming back from the manual tool loop
+        if isinstance(content, list):
+            response = getattr(content[0], "function_response", None)
+            name = response.name if response is not None else None
+            result = dict(response.response).get("result") if response is not None else None
+            return FakeResponse(self._answer(name, result), stream)
+
+        match = ZIP_PATTERN.search(str(content))
+        if match and "get_zipcode_data" in self.model.tools:
+            args = {"zipcode": match.group(1)}
+            if self.auto_call:
+                result = self.model.tools["get_zipcode_data"](**args)
+                return FakeResponse(self._answer("get_zipcode_data", result), stream)
+            return FakeResponse([_call_part("get_zipcode_data", args)], stream)
+
+        return FakeResponse(self._answer(None, None), stream)
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str, tools: Optional[List[Callable]] = None, system_instruction: str = ""):
+        self.model_name = model_name
+        self.tools = {t.__name__: t for t in (tools or [])}
+        self.system_instruction = system_instruction
+
+    def start_chat(self, history=None, enable_automatic_function_calling: bool = False):
+        return FakeChatSession(self, history, enable_automatic_function_calling)
+
+
+def fake_embed_content(model: str, content: str, task_type: Optional[str] = None, dimensions: int = 768, **kwargs):
+    """
+    Deterministic stand-in for genai.embed_content: a hashed bag of words,
+    so identical or near-identical texts get similar vectors.
+    """
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", str(content).lower()):
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    return {"embedding": vector}
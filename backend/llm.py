@@ -0,0 +1,145 @@
+"""
+Bounded worker pool for blocking Gemini SDK calls.
+
+The google-generativeai chat API is synchronous, so model calls run on a
+dedicated thread pool with a fixed number of workers and a bounded queue.
+When workers and queue are full, new calls are rejected immediately
+(PoolSaturated -> HTTP 429) instead of piling up, and every call has a
+deadline (LLMTimeout -> HTTP 504). Queue wait and model time are measured
+separately.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import google.generativeai as genai
+
+
+class PoolSaturated(Exception):
+    """All workers busy and the queue is full"""
+
+
+class LLMTimeout(Exception):
+    """The call did not finish within its deadline"""
+
+
+_configured_key: Optional[str] = None
+_configure_lock = threading.Lock()
+
+
+def configure_genai() -> bool:
+    """Configure the SDK once per API key instead of on every request"""
+    global _configured_key
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return False
+    with _configure_lock:
+        if _configured_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+    return True
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct))], 1)
+
+
+class LLMWorkerPool:
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, timeout: float = 60.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._pending = 0  # queued + running
+        self._running = 0
+        self._counters = {"completed": 0, "failed": 0, "rejected": 0, "timed_out": 0}
+        self._queue_wait_ms = deque(maxlen=500)
+        self._model_ms = deque(maxlen=500)
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self._pending - self._running
+
+    def is_saturated(self) -> bool:
+        with self._lock:
+            return self._pending >= self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable[..., Any], *args, timeout: Optional[float] = None,
+                  timing: Optional[Dict[str, float]] = None) -> Any:
+        """
+        Run fn(*args) on the pool and await its result.
+        `timing`, if given, receives queue_wait_ms and model_ms for this call.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._counters["rejected"] += 1
+                raise PoolSaturated(f"LLM pool saturated ({self._pending} calls in flight)")
+            self._pending += 1
+
+        timing = timing if timing is not None else {}
+        enqueued = time.perf_counter()
+        # Tools called by the model read per-turn ContextVars; carry them into the worker
+        ctx = contextvars.copy_context()
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+            timing["queue_wait_ms"] = (started - enqueued) * 1000
+            ok = False
+            try:
+                result = ctx.run(fn, *args)
+                ok = True
+                return result
+            finally:
+                timing["model_ms"] = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    # Slot is released only when the thread is actually free,
+                    # even if the caller already gave up on a timeout.
+                    self._pending -= 1
+                    self._running -= 1
+                    self._counters["completed" if ok else "failed"] += 1
+                    self._queue_wait_ms.append(timing["queue_wait_ms"])
+                    self._model_ms.append(timing["model_ms"])
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, job)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._counters["timed_out"] += 1
+            raise LLMTimeout(f"LLM call exceeded {timeout or self.timeout:.0f}s")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            queue_wait = list(self._queue_wait_ms)
+            model = list(self._model_ms)
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                **self._counters,
+                "queue_wait_ms": {"p50": _percentile(queue_wait, 0.5), "p95": _percentile(queue_wait, 0.95)},
+                "model_ms": {"p50": _percentile(model, 0.5), "p95": _percentile(model, 0.95)},
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+llm_pool = LLMWorkerPool(
+    max_workers=int(os.getenv("LLM_MAX_WORKERS", "4")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "16")),
+    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+)
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager, suppress
 from dotenv import load_dotenv
+import asyncio
 import os
 
 # Load environment variables
@@ -12,10 +14,45 @@ try:
 except ImportError:
     from routers import chat, data
 
+try:
+    from backend.db import init_supabase, close_supabase
+    from backend.llm import configure_genai, llm_pool
+    from backend.snapshot import snapshot_store
+    from backend.vector_index import document_index
+except ImportError:
+    from db import init_supabase, close_supabase
+    from llm import configure_genai, llm_pool
+    from snapshot import snapshot_store
+    from vector_index import document_index
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Supabase client for every router and tool call
+    init_supabase()
+    configure_genai()
+    # Load the per-ZIP snapshot before serving and keep it fresh in the background
+    await asyncio.to_thread(snapshot_store.reload_if_changed)
+    # Knowledge-base embeddings for local top-k search (pgvector stays the source of truth)
+    await asyncio.to_thread(document_index.sync)
+    watchers = [
+        asyncio.create_task(snapshot_store.watch()),
+        asyncio.create_task(document_index.watch())
+    ]
+    try:
+        yield
+    finally:
+        for watcher in watchers:
+            watcher.cancel()
+            with suppress(asyncio.CancelledError):
+                await watcher
+        close_supabase()
+        llm_pool.shutdown()
+
 app = FastAPI(
     title="DC Crime & Real Estate Chatbot API",
     description="API for querying DC crime and real estate data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
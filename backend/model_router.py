@@ -0,0 +1,216 @@
+"""
+Model failover for the chat endpoints.
+
+Each model gets a circuit breaker over a sliding window of recent errors:
+after `failure_threshold` failures within `error_window` seconds the model is
+skipped for `cooldown` seconds, then a single probe request decides whether
+it closes again. ModelRouter.execute() tries healthy models in preference
+order and, if `hedge_after` is set, starts the next model once that latency
+budget expires; the first good answer wins. Model objects are built once and
+reused across requests.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from backend.llm import PoolSaturated, LLMTimeout
+except ImportError:
+    from llm import PoolSaturated, LLMTimeout
+
+
+class AllModelsFailed(Exception):
+    """No model produced an answer (all failed or all circuits open)"""
+
+
+class ModelHealth:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, error_window: float = 60.0, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.error_window = error_window
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._failures = deque()
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._failures and now - self._failures[0] > self.error_window:
+            self._failures.popleft()
+
+    def _refresh_state(self, now: float):
+        if self.state == self.OPEN and now - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+    def available(self) -> bool:
+        """Whether a request could be sent now (does not claim the half-open probe)"""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            return self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._probe_in_flight)
+
+    def allow(self) -> bool:
+        """Claim permission to send a request now; in half-open state only one probe gets it"""
+        with self._lock:
+            self._refresh_state(time.monotonic())
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def release(self):
+        """Give back an unused half-open probe (request never reached the model)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._probe_in_flight = False
+            self._failures.clear()
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            now = time.monotonic()
+            self._last_error = str(error)
+            self._failures.append(now)
+            self._trim(now)
+            if self.state == self.HALF_OPEN or len(self._failures) >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = now
+                self._probe_in_flight = False
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "state": self.state,
+                "recent_failures": len(self._failures),
+                "last_error": self._last_error,
+            }
+
+
+class ModelRouter:
+    def __init__(self, model_names: List[str], factory: Callable[[str], Any],
+                 hedge_after: Optional[float] = None, can_hedge: Callable[[], bool] = lambda: True,
+                 **health_options):
+        self.model_names = list(model_names)
+        self.factory = factory
+        self.hedge_after = hedge_after or None
+        self.can_hedge = can_hedge
+        self.health = {name: ModelHealth(**health_options) for name in self.model_names}
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str):
+        """The model object for a name, constructed on first use and then reused"""
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    model = self._models[model_name] = self.factory(model_name)
+        return model
+
+    def reset(self):
+        """Drop constructed models (e.g. after the backend/API key changes)"""
+        with self._lock:
+            self._models.clear()
+
+    def candidates(self) -> List[str]:
+        return [name for name in self.model_names if self.health[name].available()]
+
+    def record(self, model_name: str, error: Optional[Exception]):
+        if error is None:
+            self.health[model_name].record_success()
+        elif isinstance(error, PoolSaturated):
+            # Saturation says nothing about the model itself
+            self.health[model_name].release()
+        else:
+            self.health[model_name].record_failure(error)
+
+    async def execute(self, call: Callable[[str], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Run `call(model_name)` against healthy models, in preference order.
+        A failure moves on to the next model at once; with hedging enabled, a
+        slow model gets a parallel request to the next one after `hedge_after`
+        seconds. Returns (result, model_name) of the first success.
+        """
+        names = self.candidates()
+        if not names:
+            raise AllModelsFailed("All models are temporarily unavailable (circuit open)")
+
+        pending: Dict[asyncio.Task, str] = {}
+        last_error: Optional[Exception] = None
+        next_index = 0
+
+        def launch() -> bool:
+            nonlocal next_index
+            while next_index < len(names):
+                name = names[next_index]
+                next_index += 1
+                if self.health[name].allow():
+                    pending[asyncio.create_task(call(name))] = name
+                    return True
+            return False
+
+        def settle_in_background(task: asyncio.Task, name: str):
+            # Losing hedged requests still report their outcome to the breaker
+            task.add_done_callback(
+                lambda t: self.record(name, None if t.cancelled() else t.exception())
+            )
+
+        if not launch():
+            raise AllModelsFailed("All models are temporarily unavailable (circuit open)")
+        while pending:
+            hedge = self.hedge_after if next_index < len(names) and self.can_hedge() else None
+            done, _ = await asyncio.wait(pending, timeout=hedge, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:
+                if launch():
+                    print(f"⏱️ No answer after {hedge}s, hedging with {list(pending.values())[-1]}")
+                continue
+
+            for task in done:
+                name = pending.pop(task)
+                error = task.exception()
+                self.record(name, error)
+                if error is None:
+                    for other, other_name in pending.items():
+                        settle_in_background(other, other_name)
+                    return task.result(), name
+
+                last_error = error
+                print(f"Model {name} failed: {error}")
+                if isinstance(error, PoolSaturated):
+                    for other, other_name in pending.items():
+                        settle_in_background(other, other_name)
+                    raise error
+
+            if not pending and next_index < len(names):
+                if isinstance(last_error, LLMTimeout):
+                    # The request's time budget is spent; don't start over on another model
+                    raise last_error
+                launch()
+
+        raise AllModelsFailed(f"All models failed. Last error: {last_error}")
+
+    def status(self) -> Dict[str, Any]:
+        return {name: self.health[name].status() for name in self.model_names}
+
+
+def router_options_from_env() -> Dict[str, Any]:
+    return {
+        "hedge_after": float(os.getenv("MODEL_HEDGE_AFTER", "0")),
+        "failure_threshold": int(os.getenv("MODEL_FAILURE_THRESHOLD", "3")),
+        "error_window": float(os.getenv("MODEL_ERROR_WINDOW", "60")),
+        "cooldown": float(os.getenv("MODEL_COOLDOWN", "30")),
+    }
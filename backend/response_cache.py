@@ -0,0 +1,167 @@
+"""
+Response cache for repeated chat questions.
+
+Answers are keyed on the normalized query plus a scope: the ZIP the user is
+viewing, their weight bucket and the data snapshot version. An exact key match
+is a hit; otherwise, if an embedding function is configured, the query is
+compared with cached queries in the same scope and a cosine similarity above
+`similarity_threshold` counts as a near-duplicate hit, but only if both
+queries mention the same numbers (ZIP codes, years, counts): embeddings put
+"is 20001 safe" and "is 20002 safe" almost on top of each other, so the
+numbers are compared literally. Entries expire after
+`ttl` seconds, the least recently used entry is evicted beyond `max_entries`,
+and everything is dropped when the snapshot version changes.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.。？！]+$")
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def normalize_query(query: str) -> str:
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", query.strip().lower()))
+
+
+def query_entities(normalized: str) -> Tuple[str, ...]:
+    """ZIP codes and other numbers in a query, in order; a semantic hit must match them exactly"""
+    return tuple(_NUMBER.findall(normalized))
+
+
+def weight_bucket(weights: Optional[Dict[str, float]], step: float = 0.1) -> Optional[str]:
+    """Round weights so nearby slider positions share cache entries"""
+    if not weights:
+        return None
+    w1 = round(round(weights.get("growth_w1", 0.5) / step) * step, 2)
+    w2 = round(round(weights.get("safety_w2", 0.5) / step) * step, 2)
+    return f"{w1}:{w2}"
+
+
+@dataclass(frozen=True)
+class CacheScope:
+    current_zip: Optional[str]
+    weights: Optional[str]
+    snapshot_version: Optional[str]
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    scope: CacheScope
+    embedding: Optional[np.ndarray]
+    created_at: float
+    entities: Tuple[str, ...] = ()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, similarity_threshold: float = 0.92,
+                 embed: Optional[Callable[[str], np.ndarray]] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self._entries: "OrderedDict[Tuple[str, CacheScope], CachedResponse]" = OrderedDict()
+        self._snapshot_version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _sync_version(self, snapshot_version: Optional[str]):
+        if snapshot_version != self._snapshot_version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._snapshot_version = snapshot_version
+
+    def _expired(self, entry: CachedResponse, now: float) -> bool:
+        return now - entry.created_at > self.ttl
+
+    def _embed(self, normalized: str) -> Optional[np.ndarray]:
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(self.embed(normalized), dtype=np.float32)
+        except Exception as e:
+            print(f"Response cache embedding failed: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, query: str, scope: CacheScope) -> Tuple[Optional[str], Optional[np.ndarray], Optional[str]]:
+        """
+        Returns (response, query_embedding, hit_kind). hit_kind is "exact",
+        "semantic" or None. The embedding (computed on exact misses) can be
+        passed back to store() to avoid embedding the query twice.
+        """
+        normalized = normalize_query(query)
+        key = (normalized, scope)
+        now = time.monotonic()
+
+        with self._lock:
+            self._sync_version(scope.snapshot_version)
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return entry.response, entry.embedding, "exact"
+
+        # Embedding is a network call; don't hold the lock for it
+        embedding = self._embed(normalized)
+        if embedding is not None:
+            entities = query_entities(normalized)
+            with self._lock:
+                best_key, best_score = None, self.similarity_threshold
+                for other_key, other in self._entries.items():
+                    if other.scope != scope or other.embedding is None or self._expired(other, now):
+                        continue
+                    if other.entities != entities:
+                        continue
+                    score = float(np.dot(embedding, other.embedding))
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self._stats["semantic_hits"] += 1
+                    return self._entries[best_key].response, embedding, "semantic"
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None, embedding, None
+
+    def store(self, query: str, scope: CacheScope, response: str, embedding: Optional[np.ndarray] = None):
+        now = time.monotonic()
+        with self._lock:
+            self._sync_version(scope.snapshot_version)
+            normalized = normalize_query(query)
+            key = (normalized, scope)
+            self._entries[key] = CachedResponse(response, scope, embedding, now, query_entities(normalized))
+            self._entries.move_to_end(key)
+
+            # Expired entries go first, then least recently used
+            for stale in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[stale]
+                self._stats["evictions"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+            total = hits + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                **self._stats,
+                "hit_rate": round(hits / total, 3) if total else None,
+            }
@@ -1,11 +1,39 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from supabase import create_client, Client
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+import asyncio
+import json
 import os
+import threading
+import time
 import google.generativeai as genai
-from typing import List, Optional, Dict, Any
+from typing import Callable, List, Optional, Dict, Any
 from google.generativeai.types import FunctionDeclaration, Tool
 
+try:
+    from backend.db import get_supabase
+    from backend.embedding_cache import embedding_cache
+    from backend.fake_model import FakeGenerativeModel, fake_embed_content
+    from backend.llm import llm_pool, configure_genai, PoolSaturated, LLMTimeout
+    from backend.model_router import ModelRouter, AllModelsFailed, router_options_from_env
+    from backend.response_cache import ResponseCache, CacheScope, weight_bucket
+    from backend.snapshot import snapshot_store, to_plain
+    from backend.vector_index import document_index
+except ImportError:
+    from db import get_supabase
+    from embedding_cache import embedding_cache
+    from fake_model import FakeGenerativeModel, fake_embed_content
+    from llm import llm_pool, configure_genai, PoolSaturated, LLMTimeout
+    from model_router import ModelRouter, AllModelsFailed, router_options_from_env
+    from response_cache import ResponseCache, CacheScope, weight_bucket
+    from snapshot import snapshot_store, to_plain
+    from vector_index import document_index
+
 router = APIRouter()
 
 class ClientContext(BaseModel):
@@ -20,16 +48,120 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     data_sources: Optional[List[str]] = []
+    metrics: Optional[Dict[str, Any]] = None
+
+# --- Per-turn tool context ---
+
+# DB lookups inside a tool run concurrently here; prefetches use their own pool
+# so a prefetch waiting on its sub-queries can never starve them.
+_query_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_QUERY_WORKERS", "8")), thread_name_prefix="chat-query")
+_prefetch_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CHAT_PREFETCH_WORKERS", "4")), thread_name_prefix="chat-prefetch")
+
+@dataclass
+class TurnContext:
+    prefetch: Dict[str, Future] = field(default_factory=dict)
+    tool_calls: List[Dict[str, Any]] = field(default_factory=list)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "tool_calls": self.tool_calls,
+            "tool_ms_total": round(sum(c["ms"] for c in self.tool_calls), 1)
+        }
+
+# Set by the endpoint for the duration of one turn; tool threads inherit it
+_turn: ContextVar[Optional[TurnContext]] = ContextVar("chat_turn", default=None)
+
+@contextmanager
+def tool_timer(name: str, **info):
+    """Record a tool call's latency on the current turn"""
+    start = time.perf_counter()
+    try:
+        yield info
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        print(f"🛠️ Tool {name} took {ms:.1f} ms")
+        turn = _turn.get()
+        if turn is not None:
+            turn.tool_calls.append({"tool": name, "ms": round(ms, 1), **info})
+
+# --- Model backend ---
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+def use_fake_model() -> bool:
+    return os.getenv("CHAT_MODEL_BACKEND", "gemini").lower() == "fake"
 
-def get_supabase() -> Client:
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
-    if not url or not key:
-        raise HTTPException(status_code=500, detail="Supabase credentials not configured")
-    return create_client(url, key)
+def embed_content(**kwargs):
+    """genai.embed_content, or its local fake when CHAT_MODEL_BACKEND=fake"""
+    if use_fake_model():
+        return fake_embed_content(**kwargs)
+    return genai.embed_content(**kwargs)
+
+def embed_text(text: str, task_type: str):
+    """Query embedding through the memory/SQLite cache; the API is only called on a miss"""
+    model = EMBEDDING_MODEL + (":fake" if use_fake_model() else "")
+    return embedding_cache.get_or_embed(
+        text, model, task_type,
+        lambda t: embed_content(model=EMBEDDING_MODEL, content=t, task_type=task_type)["embedding"]
+    )
 
 # --- Tool Definitions ---
 
+def _query_summary(zipcode: str):
+    stats = get_supabase().table("zipcode_stats").select("*").eq("zip_code", zipcode).execute()
+    return stats.data[0] if stats.data else None
+
+def _query_recent_crimes(zipcode: str):
+    crimes = get_supabase().table("crimes").select("offense, report_dat, block").eq("zip_code", zipcode).order("report_dat", desc=True).limit(5).execute()
+    return crimes.data or None
+
+def _query_housing_trends(zipcode: str):
+    history = get_supabase().table("house_ts").select("*").eq("zip_code", zipcode).order("date", desc=True).limit(5).execute()
+    return history.data or None
+
+def fetch_zipcode_bundle(zipcode: str) -> Dict[str, Any]:
+    """
+    Collect summary, recent crimes and housing trends for a ZIP.
+    The in-memory snapshot answers what it can; the remaining Supabase
+    lookups run concurrently instead of one after another.
+    """
+    data = {}
+
+    bundle = snapshot_store.get(zipcode)
+    if bundle:
+        data["summary"] = {
+            k: to_plain(v) for k, v in bundle.items()
+            if k not in ("recent_crimes", "housing_trends")
+        }
+        if bundle.get("recent_crimes"):
+            data["recent_crimes"] = to_plain(bundle["recent_crimes"][:5])
+        if bundle.get("housing_trends"):
+            data["housing_trends"] = to_plain(bundle["housing_trends"][:5])
+
+    queries = {
+        "summary": _query_summary,
+        "recent_crimes": _query_recent_crimes,
+        "housing_trends": _query_housing_trends
+    }
+    futures = {
+        key: _query_executor.submit(query, zipcode)
+        for key, query in queries.items() if key not in data
+    }
+    for key, future in futures.items():
+        try:
+            result = future.result()
+            if result:
+                data[key] = result
+        except Exception as e:
+            print(f"Error fetching {key}: {e}")
+
+    return data
+
+def prefetch_zipcode_bundle(turn: TurnContext, zipcode: str):
+    """Start loading a ZIP's bundle while the model is still thinking"""
+    if zipcode not in turn.prefetch:
+        turn.prefetch[zipcode] = _prefetch_executor.submit(fetch_zipcode_bundle, zipcode)
+
 def get_zipcode_data(zipcode: str):
     """
     Fetches comprehensive crime and real estate data for a specific DC ZIP code.
@@ -39,33 +171,11 @@ def get_zipcode_data(zipcode: str):
         zipcode: The 5-digit ZIP code (e.g., '20001').
     """
     print(f"🛠️ Tool Called: get_zipcode_data({zipcode})")
-    supabase = get_supabase()
-    
-    data = {}
-    
-    # 1. Summary Stats
-    try:
-        stats = supabase.table("zipcode_stats").select("*").eq("zip_code", zipcode).execute()
-        if stats.data:
-            data["summary"] = stats.data[0]
-    except Exception as e:
-        print(f"Error fetching stats: {e}")
-
-    # 2. Recent Crimes
-    try:
-        crimes = supabase.table("crimes").select("offense, report_dat, block").eq("zip_code", zipcode).order("report_dat", desc=True).limit(5).execute()
-        if crimes.data:
-            data["recent_crimes"] = crimes.data
-    except Exception as e:
-        print(f"Error fetching crimes: {e}")
 
-    # 3. Housing Trends
-    try:
-        history = supabase.table("house_ts").select("*").eq("zip_code", zipcode).order("date", desc=True).limit(5).execute()
-        if history.data:
-            data["housing_trends"] = history.data
-    except Exception as e:
-        print(f"Error fetching history: {e}")
+    turn = _turn.get()
+    prefetched = turn.prefetch.get(zipcode) if turn else None
+    with tool_timer("get_zipcode_data", zipcode=zipcode, prefetched=prefetched is not None):
+        data = prefetched.result() if prefetched else fetch_zipcode_bundle(zipcode)
         
     if not data:
         return {"error": f"No data found for ZIP {zipcode}"}
@@ -84,29 +194,35 @@ def search_knowledge_base(query: str):
         query: The search query string (e.g., "HCI formula", "ethics of crime data").
     """
     print(f"🛠️ Tool Called: search_knowledge_base({query})")
-    supabase = get_supabase()
-    
+    with tool_timer("search_knowledge_base", query=query):
+        return _search_knowledge_base(query)
+
+KB_MATCH_THRESHOLD = 0.5 # Adjust threshold as needed
+KB_MATCH_COUNT = 3
+
+def _search_knowledge_base(query: str):
     try:
-        # 1. Generate Embedding for query
-        result = genai.embed_content(
-            model="models/text-embedding-004",
-            content=query,
-            task_type="retrieval_query"
-        )
-        query_embedding = result['embedding']
+        # 1. Embedding for query (cached; only a miss calls the API)
+        query_embedding = embed_text(query, "retrieval_query")
         
-        # 2. Call RPC function
-        response = supabase.rpc(
-            'match_documents',
-            {
-                'query_embedding': query_embedding,
-                'match_threshold': 0.5, # Adjust threshold as needed
-                'match_count': 3
-            }
-        ).execute()
+        # 2. Search the in-process index; fall back to the RPC until it has loaded
+        if document_index.ready:
+            documents = document_index.search(query_embedding, KB_MATCH_COUNT, KB_MATCH_THRESHOLD)
+        else:
+            documents = get_supabase().rpc(
+                'match_documents',
+                {
+                    'query_embedding': query_embedding.tolist(),
+                    'match_threshold': KB_MATCH_THRESHOLD,
+                    'match_count': KB_MATCH_COUNT,
+                    'metadata_filter': {}
+                }
+            ).execute().data
+            if documents:
+                print(f"match_documents took {documents[0].get('query_ms', 0):.1f} ms in Postgres")
         
-        if response.data:
-            return {"documents": response.data}
+        if documents:
+            return {"documents": documents}
         else:
             return {"message": "No relevant documents found in knowledge base."}
             
@@ -116,37 +232,24 @@ def search_knowledge_base(query: str):
 
 # --- Chat Endpoint ---
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest, supabase: Client = Depends(get_supabase)):
-    """
-    Context-Aware Chat endpoint using Gemini Function Calling.
-    """
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-    if not gemini_api_key:
-        return ChatResponse(response="Error: GEMINI_API_KEY not configured.")
+MODELS_TO_TRY = [
+    "gemini-2.0-flash-exp",
+    "gemini-1.5-flash-latest",
+    "gemini-1.5-pro-latest"
+]
 
-    genai.configure(api_key=gemini_api_key)
+TOOLS = [get_zipcode_data, search_knowledge_base]
+TOOLS_BY_NAME = {tool.__name__: tool for tool in TOOLS}
 
-    # 1. Prepare Context String
-    context_str = ""
-    if request.client_context:
-        if request.client_context.current_zip:
-            context_str += f"User is currently viewing ZIP Code: {request.client_context.current_zip}.\n"
-        if request.client_context.weights:
-            w1 = request.client_context.weights.get("growth_w1", 0.5)
-            w2 = request.client_context.weights.get("safety_w2", 0.5)
-            context_str += f"User Preferences: Growth Weight (w1)={w1}, Safety Weight (w2)={w2}.\n"
-            if w1 > w2:
-                context_str += "User prioritizes Investment Potential over Safety.\n"
-            elif w2 > w1:
-                context_str += "User prioritizes Safety over Investment Potential.\n"
+# Upper bound on model -> tool -> model round trips in a streamed turn
+MAX_TOOL_ROUNDS = 4
 
-    # 2. System Prompt
-    system_prompt = f"""You are an expert real estate and safety analyst for Washington DC.
+SYSTEM_PROMPT = """You are an expert real estate and safety analyst for Washington DC.
     Your goal is to provide insightful, opinionated, and helpful advice.
     
     **Current Context:**
-    {context_str}
+    When present, the user's message starts with a **Current Context** block
+    (the ZIP code they are viewing and their weight preferences). Use it.
     
     **Tools:**
     1. `get_zipcode_data(zipcode)`: For specific area stats, prices, crime.
@@ -165,37 +268,269 @@ async def chat_endpoint(request: ChatRequest, supabase: Client = Depends(get_sup
     5.  **Tone**: Professional, conversational, direct.
     """
 
-    # 3. Initialize Model with Tools
-    tools = [get_zipcode_data, search_knowledge_base]
-    
-    models_to_try = [
-        "gemini-2.0-flash-exp",
-        "gemini-1.5-flash-latest",
-        "gemini-1.5-pro-latest"
-    ]
+def make_model(model_name: str):
+    """Gemini model, or the local fake (CHAT_MODEL_BACKEND=fake) for offline testing"""
+    if use_fake_model():
+        return FakeGenerativeModel(model_name, tools=TOOLS, system_instruction=SYSTEM_PROMPT)
+    return genai.GenerativeModel(model_name, tools=TOOLS, system_instruction=SYSTEM_PROMPT)
 
-    last_error = None
+# Models are built once; the per-user context travels in the message instead
+# of the system instruction so the same model objects serve every request.
+model_router = ModelRouter(
+    MODELS_TO_TRY,
+    make_model,
+    can_hedge=lambda: not llm_pool.is_saturated(),
+    **router_options_from_env()
+)
+
+def build_message(query: str, client_context: Optional[ClientContext]) -> str:
+    # 1. Prepare Context String
+    context_str = ""
+    if client_context:
+        if client_context.current_zip:
+            context_str += f"User is currently viewing ZIP Code: {client_context.current_zip}.\n"
+        if client_context.weights:
+            w1 = client_context.weights.get("growth_w1", 0.5)
+            w2 = client_context.weights.get("safety_w2", 0.5)
+            context_str += f"User Preferences: Growth Weight (w1)={w1}, Safety Weight (w2)={w2}.\n"
+            if w1 > w2:
+                context_str += "User prioritizes Investment Potential over Safety.\n"
+            elif w2 > w1:
+                context_str += "User prioritizes Safety over Investment Potential.\n"
 
-    # 4. Construct History
+    if not context_str:
+        return query
+    return f"**Current Context:**\n{context_str}\n{query}"
+
+def build_history(history: Optional[List[dict]]) -> List[dict]:
     chat_history = []
-    for msg in request.history[-5:]:
+    for msg in (history or [])[-5:]:
         role = "user" if msg.get("role") == "user" else "model"
         chat_history.append({"role": role, "parts": [msg.get("content", "")]})
+    return chat_history
+
+def start_turn(request: ChatRequest) -> TurnContext:
+    """Per-turn tool context; warm up the ZIP the user is looking at"""
+    turn = TurnContext()
+    _turn.set(turn)
+    if request.client_context and request.client_context.current_zip:
+        prefetch_zipcode_bundle(turn, request.client_context.current_zip)
+    return turn
+
+def embed_for_cache(text: str):
+    return embed_text(text, "semantic_similarity")
+
+response_cache = ResponseCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    similarity_threshold=float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.92")),
+    embed=embed_for_cache if os.getenv("RESPONSE_CACHE_SEMANTIC", "1") != "0" else None
+)
+
+def cache_scope(request: ChatRequest) -> Optional[CacheScope]:
+    """Scope for caching this request, or None when it must not be cached"""
+    if request.history:
+        # Answers depend on the conversation so far; only stand-alone questions are cached
+        return None
+    context = request.client_context or ClientContext()
+    return CacheScope(
+        current_zip=context.current_zip,
+        weights=weight_bucket(context.weights),
+        snapshot_version=snapshot_store.version
+    )
+
+def llm_timing(timing: Dict[str, float]) -> Dict[str, float]:
+    return {k: round(v, 1) for k, v in timing.items()}
+
+@router.get("/chat/metrics")
+async def chat_metrics():
+    """LLM pool saturation, queue wait, model latency and per-model health"""
+    return {**llm_pool.metrics(), "models": model_router.status(), "response_cache": response_cache.stats(), "embedding_cache": embedding_cache.stats(), "document_index": document_index.status()}
+
+@router.post("/chat", response_model=ChatResponse)
+async def chat_endpoint(request: ChatRequest):
+    """
+    Context-Aware Chat endpoint using Gemini Function Calling.
+    """
+    if not use_fake_model() and not configure_genai():
+        return ChatResponse(response="Error: GEMINI_API_KEY not configured.")
+
+    scope = cache_scope(request)
+    query_embedding = None
+    if scope is not None:
+        cached, query_embedding, hit = await run_in_threadpool(response_cache.lookup, request.query, scope)
+        if cached is not None:
+            return ChatResponse(response=cached, metrics={"cache": hit})
+
+    message = build_message(request.query, request.client_context)
+    chat_history = build_history(request.history)
+    turn = start_turn(request)
+
+    async def ask(model_name: str):
+        # Enable automatic function calling
+        chat = model_router.get(model_name).start_chat(history=chat_history, enable_automatic_function_calling=True)
+        # Blocking SDK call (and the tools it invokes) run on the bounded LLM pool
+        timing = {}
+        response = await llm_pool.run(chat.send_message, message, timing=timing)
+        return response.text, timing
+
+    try:
+        (text, timing), model_name = await model_router.execute(ask)
+    except PoolSaturated:
+        raise HTTPException(status_code=429, detail="Chat is busy, please retry shortly.", headers={"Retry-After": "2"})
+    except LLMTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except AllModelsFailed as e:
+        return ChatResponse(response=f"Error: {e}", metrics=turn.metrics())
 
-    for model_name in models_to_try:
+    if scope is not None:
+        response_cache.store(request.query, scope, text, query_embedding)
+
+    return ChatResponse(response=text, metrics={**turn.metrics(), **llm_timing(timing), "model": model_name})
+
+# --- Streaming Chat Endpoint (Server-Sent Events) ---
+
+# Keeps producers of disconnected streams referenced until their worker exits
+_stream_producers = set()
+
+class StreamCancelled(Exception):
+    """The client disconnected; stop generating"""
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_turn(message: str, chat_history: List[dict],
+                emit: Callable[[str, Dict[str, Any]], None], cancelled: threading.Event):
+    """
+    Blocking producer run on the LLM pool. Drives the function-calling loop by
+    hand (automatic function calling cannot stream) and emits events as
+    text chunks arrive and tools run. Follows the same per-model health as
+    /chat, but never hedges: a second stream would interleave its output.
+    """
+    last_error = None
+    for model_name in model_router.candidates():
+        if not model_router.health[model_name].allow():
+            continue
+        started_output = False
         try:
-            model = genai.GenerativeModel(model_name, tools=tools, system_instruction=system_prompt)
-            
-            # Enable automatic function calling
-            chat = model.start_chat(history=chat_history, enable_automatic_function_calling=True)
-            
-            response = chat.send_message(request.query)
-            
-            return ChatResponse(response=response.text)
+            chat = model_router.get(model_name).start_chat(history=chat_history)
+            outgoing = message
+            for _ in range(MAX_TOOL_ROUNDS + 1):
+                calls = []
+                for chunk in chat.send_message(outgoing, stream=True):
+                    if cancelled.is_set():
+                        raise StreamCancelled()
+                    for part in chunk.parts:
+                        fn = getattr(part, "function_call", None)
+                        if not started_output and ((fn and fn.name) or part.text):
+                            started_output = True
+                            emit("model", {"model": model_name})
+                        if fn and fn.name:
+                            calls.append(fn)
+                        elif part.text:
+                            emit("token", {"text": part.text})
 
+                if not calls:
+                    model_router.record(model_name, None)
+                    return
+
+                responses = []
+                for fn in calls:
+                    args = {k: v for k, v in fn.args.items()}
+                    emit("tool_call", {"name": fn.name, "args": args})
+                    tool = TOOLS_BY_NAME.get(fn.name)
+                    result = tool(**args) if tool else {"error": f"Unknown tool {fn.name}"}
+                    emit("tool_result", {"name": fn.name, "ok": "error" not in result})
+                    responses.append(genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                        name=fn.name, response={"result": result}
+                    )))
+                outgoing = responses
+            model_router.record(model_name, None)
+            emit("error", {"detail": "Too many tool rounds"})
+            return
+        except StreamCancelled:
+            model_router.health[model_name].release()
+            return
         except Exception as e:
             last_error = e
+            model_router.record(model_name, e)
             print(f"Model {model_name} failed: {e}")
-            continue
+            if started_output:
+                # Partial answer already sent; switching models would garble it
+                emit("error", {"detail": str(e)})
+                return
+    emit("error", {"detail": f"All models failed. Last error: {last_error}"})
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Streaming variant of /chat. Emits Server-Sent Events:
+    model, token (partial text), tool_call, tool_result, error, done (metrics).
+    """
+    if not use_fake_model() and not configure_genai():
+        raise HTTPException(status_code=500, detail="GEMINI_API_KEY not configured.")
+    if llm_pool.is_saturated():
+        raise HTTPException(status_code=429, detail="Chat is busy, please retry shortly.", headers={"Retry-After": "2"})
+
+    scope = cache_scope(request)
+    query_embedding = None
+    if scope is not None:
+        cached, query_embedding, hit = await run_in_threadpool(response_cache.lookup, request.query, scope)
+        if cached is not None:
+            async def cached_stream():
+                yield sse_event("model", {"model": "cache"})
+                yield sse_event("token", {"text": cached})
+                yield sse_event("done", {"cache": hit})
+            return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    message = build_message(request.query, request.client_context)
+    chat_history = build_history(request.history)
+    turn = start_turn(request)
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    cancelled = threading.Event()
+    answer = {"text": [], "error": False}
+
+    def emit(event: str, data: Dict[str, Any]):
+        if event == "token":
+            answer["text"].append(data["text"])
+        elif event == "error":
+            answer["error"] = True
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    async def produce():
+        timing = {}
+        try:
+            await llm_pool.run(stream_turn, message, chat_history, emit, cancelled, timing=timing)
+            if scope is not None and not answer["error"] and not cancelled.is_set() and answer["text"]:
+                response_cache.store(request.query, scope, "".join(answer["text"]), query_embedding)
+        except PoolSaturated:
+            emit("error", {"detail": "Chat is busy, please retry shortly."})
+        except LLMTimeout as e:
+            cancelled.set()
+            emit("error", {"detail": str(e)})
+        finally:
+            emit("done", {**turn.metrics(), **llm_timing(timing)})
+
+    async def event_stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                event, data = await events.get()
+                yield sse_event(event, data)
+                if event == "done":
+                    break
+        finally:
+            # Client went away (or we finished): tell the worker to stop early.
+            # The producer finishes on its own once the worker notices.
+            cancelled.set()
+            if not producer.done():
+                _stream_producers.add(producer)
+                producer.add_done_callback(_stream_producers.discard)
 
-    return ChatResponse(response=f"Error: All models failed. Last error: {str(last_error)}")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,48 +1,259 @@
-from fastapi import APIRouter, HTTPException, Depends
-from supabase import create_client, Client
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from supabase import Client
+from datetime import datetime, timedelta, timezone
 import os
 from typing import List, Optional
 
+try:
+    from backend.cache import CachedResource, is_not_modified
+    from backend.db import get_supabase
+    from backend.snapshot import snapshot_store, to_plain
+except ImportError:
+    from cache import CachedResource, is_not_modified
+    from db import get_supabase
+    from snapshot import snapshot_store, to_plain
+
 router = APIRouter()
 
-def get_supabase() -> Client:
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
-    if not url or not key:
-        raise HTTPException(status_code=500, detail="Supabase credentials not configured")
-    return create_client(url, key)
+RECENT_CRIMES_LIMIT = 10
+RECENT_CRIME_COLUMNS = "ccn, offense, report_dat, block, shift, method"
+
+def fetch_recent_crimes(supabase: Client, zipcode: str, limit: int = RECENT_CRIMES_LIMIT) -> list:
+    """Most recent incidents for a ZIP (served by idx_crimes_zip_report_dat)"""
+    response = (
+        supabase.table("crimes")
+        .select(RECENT_CRIME_COLUMNS)
+        .eq("zip_code", zipcode)
+        .order("report_dat", desc=True)
+        .limit(limit)
+        .execute()
+    )
+    return response.data or []
+
+def fetch_crime_stats(supabase: Client, zipcode: str) -> Optional[dict]:
+    """Crime totals and histograms from the loader-maintained aggregate tables (primary-key lookups)"""
+    totals = supabase.table("zipcode_crime_totals").select("total_crimes, last_report_dat, top_offense").eq("zip_code", zipcode).limit(1).execute()
+    if not totals.data:
+        return None
+    offenses = supabase.table("zipcode_offense_counts").select("offense, crime_count").eq("zip_code", zipcode).execute()
+    shifts = supabase.table("zipcode_shift_counts").select("shift, crime_count").eq("zip_code", zipcode).execute()
+    return {
+        **totals.data[0],
+        "by_offense": {row["offense"]: row["crime_count"] for row in offenses.data or []},
+        "by_shift": {row["shift"]: row["crime_count"] for row in shifts.data or []},
+    }
+
+def fetch_zipcode_from_db(supabase: Client, zipcode: str) -> Optional[dict]:
+    """Fallback when the snapshot has no entry: aggregate tables + bounded queries"""
+    crime_stats = fetch_crime_stats(supabase, zipcode)
+    zillow = supabase.table("zillow_data").select("*").eq("zip_code", zipcode).limit(1).execute()
+    if not crime_stats and not zillow.data:
+        return None
+
+    return {
+        "zip_code": zipcode,
+        "crime_count": crime_stats["total_crimes"] if crime_stats else 0,
+        "zillow_data": zillow.data[0] if zillow.data else None,
+        "crimes": fetch_recent_crimes(supabase, zipcode),
+        "crime_stats": crime_stats,
+        "snapshot_version": None
+    }
+
+def fetch_crime_trend(supabase: Client, zipcode: str) -> list:
+    """Monthly crime counts for a ZIP, oldest first"""
+    response = (
+        supabase.table("zipcode_monthly_counts")
+        .select("month, crime_count")
+        .eq("zip_code", zipcode)
+        .order("month")
+        .execute()
+    )
+    return response.data or []
+
+def load_summary_stats():
+    """
+    Read the single-row stats_summary table (refreshed by the upload scripts).
+    Falls back to the totals recorded in the snapshot metadata at pipeline time.
+    """
+    try:
+        row = get_supabase().table("stats_summary").select("total_crimes, total_zillow_regions, refreshed_at").eq("id", 1).limit(1).execute()
+        if row.data:
+            data = row.data[0]
+            refreshed_at = datetime.fromisoformat(data["refreshed_at"])
+            return {
+                "total_crimes": data["total_crimes"],
+                "total_zillow_regions": data["total_zillow_regions"],
+                "timestamp": refreshed_at.isoformat()
+            }, refreshed_at
+    except Exception as e:
+        print(f"Error fetching stats_summary: {e}")
+
+    snapshot = snapshot_store.current
+    if snapshot is None:
+        raise RuntimeError("Summary statistics unavailable")
+    # Older artifacts carry no generated_at; fall back to when the snapshot was loaded
+    try:
+        generated_at = datetime.fromisoformat(snapshot.metadata.get("generated_at") or "")
+    except (TypeError, ValueError):
+        generated_at = snapshot.loaded_at
+    if generated_at.tzinfo is None:
+        generated_at = generated_at.replace(tzinfo=timezone.utc)
+    return {
+        "total_crimes": snapshot.metadata.get("total_crimes"),
+        "total_zillow_regions": snapshot.metadata.get("total_zillow_records"),
+        "timestamp": generated_at.isoformat()
+    }, generated_at
+
+summary_cache = CachedResource(load_summary_stats, ttl=float(os.getenv("SUMMARY_CACHE_TTL", "300")))
 
 @router.get("/stats/summary")
-async def get_summary_stats(supabase: Client = Depends(get_supabase)):
-    """Get overall summary statistics"""
+async def get_summary_stats(request: Request):
+    """Get overall summary statistics (cached, supports ETag / Last-Modified revalidation)"""
     try:
-        # This is a simplified example. In production, you might want to cache this or use a materialized view.
-        crimes_response = supabase.table("crimes").select("count", count="exact").execute()
-        zillow_response = supabase.table("zillow_data").select("count", count="exact").execute()
-        
-        return {
-            "total_crimes": crimes_response.count,
-            "total_zillow_regions": zillow_response.count,
-            "timestamp": "2025-12-06" # Dynamic in real app
-        }
+        entry = await summary_cache.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/zipcode/{zipcode}")
-async def get_zipcode_data(zipcode: str, supabase: Client = Depends(get_supabase)):
-    """Get data for a specific zipcode"""
+    headers = {
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified_header,
+        "Cache-Control": f"public, max-age={int(summary_cache.ttl)}"
+    }
+    if is_not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(entry.value, headers=headers)
+
+@router.get("/snapshot")
+async def get_snapshot_status():
+    """Version and load time of the in-memory ZIP snapshot"""
+    return snapshot_store.status()
+
+MAX_RADIUS_M = 10_000
+MAX_INCIDENTS = 200
+
+def crime_index():
+    """Spatial index from the current snapshot (503 until the crime CSV has been loaded)"""
+    index = snapshot_store.crimes
+    if index is None:
+        raise HTTPException(status_code=503, detail="Crime point index not loaded")
+    return index
+
+def time_window(index, since: Optional[datetime], until: Optional[datetime], days: Optional[int]):
+    """`days` counts back from `until`, or from the newest incident in the data"""
+    def aware(value):
+        return value.replace(tzinfo=timezone.utc) if value and value.tzinfo is None else value
+    since, until = aware(since), aware(until)
+    if days is not None:
+        end = until or index.latest_report()
+        if end is not None:
+            since = max(since, end - timedelta(days=days)) if since else end - timedelta(days=days)
+    return since, until
+
+@router.get("/crimes/near")
+async def get_crimes_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius: float = Query(500, gt=0, le=MAX_RADIUS_M, description="Meters"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = Query(None, gt=0),
+    offense: Optional[str] = None,
+    limit: int = Query(20, ge=0, le=MAX_INCIDENTS)
+):
+    """Incidents within `radius` meters of a point: counts by offense and the nearest incidents"""
+    index = crime_index()
+    since, until = time_window(index, since, until, days)
+    result = index.near(lat, lon, radius, since=since, until=until, offense=offense, limit=limit)
+    return {
+        "center": {"lat": lat, "lon": lon},
+        "radius_m": radius,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        **result,
+        "snapshot_version": snapshot_store.version
+    }
+
+@router.get("/crimes/bbox")
+async def get_crimes_in_bbox(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    days: Optional[int] = Query(None, gt=0),
+    offense: Optional[str] = None,
+    limit: int = Query(20, ge=0, le=MAX_INCIDENTS)
+):
+    """Incidents inside a bounding box: counts by offense and the most recent incidents"""
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon")
+    index = crime_index()
+    since, until = time_window(index, since, until, days)
+    result = index.within(min_lat, min_lon, max_lat, max_lon, since=since, until=until, offense=offense, limit=limit)
+    return {
+        "bbox": [min_lon, min_lat, max_lon, max_lat],
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat() if until else None,
+        **result,
+        "snapshot_version": snapshot_store.version
+    }
+
+@router.get("/zipcode/{zipcode}/crime-trend")
+async def get_crime_trend(zipcode: str):
+    """Monthly crime counts from the zipcode_monthly_counts aggregate"""
     try:
-        # Fetch crime stats
-        crimes = supabase.table("crimes").select("*").eq("zip_code", zipcode).execute()
-        
-        # Fetch zillow data
-        zillow = supabase.table("zillow_data").select("*").eq("zip_code", zipcode).execute()
-        
-        return {
-            "zip_code": zipcode,
-            "crime_count": len(crimes.data),
-            "zillow_data": zillow.data[0] if zillow.data else None,
-            "crimes": crimes.data[:10] # Return top 10 recent crimes
-        }
+        months = await run_in_threadpool(fetch_crime_trend, get_supabase(), zipcode)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    return {"zip_code": zipcode, "months": months}
+
+@router.get("/zipcode/{zipcode}")
+async def get_zipcode_data(zipcode: str):
+    """
+    Get data for a specific zipcode.
+    Served from the in-memory snapshot; a ZIP it does not contain is a 404.
+    Only while no snapshot is loaded does it fall back to the per-ZIP
+    aggregate tables and an ordered, limited recent-crimes query.
+    """
+    snapshot = snapshot_store.current
+    if snapshot is None:
+        try:
+            result = await run_in_threadpool(fetch_zipcode_from_db, get_supabase(), zipcode)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if result is None:
+            raise HTTPException(status_code=404, detail=f"No data found for ZIP {zipcode}")
+        return result
+
+    bundle = snapshot.get(zipcode)
+    if bundle is None:
+        raise HTTPException(status_code=404, detail=f"No data found for ZIP {zipcode}")
+
+    crime_stats = bundle.get("crime_stats") or {}
+    recent_crimes = to_plain(bundle.get("recent_crimes"))
+    if recent_crimes is None:
+        # Artifact predates recent_crimes: one indexed, bounded query
+        try:
+            recent_crimes = await run_in_threadpool(fetch_recent_crimes, get_supabase(), zipcode)
+        except Exception as e:
+            print(f"Error fetching recent crimes: {e}")
+            recent_crimes = []
+
+    return {
+        "zip_code": zipcode,
+        "crime_count": crime_stats.get("total_crimes", 0),
+        "zillow_data": to_plain(bundle.get("zillow_data")) or None,
+        "crimes": recent_crimes,
+        "crime_stats": to_plain(crime_stats),
+        "census_data": to_plain(bundle.get("census_data")),
+        "indices": to_plain(bundle.get("indices")),
+        "hci": to_plain(bundle.get("hci")),
+        "snapshot_version": snapshot.version
+    }
@@ -9,30 +9,335 @@ create table if not exists documents (
   embedding vector(768) -- Gemini embeddings are 768 dimensions
 );
 
--- Create a function to search for documents
+-- Versioning: each chunk is identified by (source, content_hash). Re-uploads
+-- upsert on that key, and chunks that disappeared from a source are
+-- tombstoned (deleted_at) rather than duplicated or left live.
+alter table documents add column if not exists source text;
+alter table documents add column if not exists section text;
+alter table documents add column if not exists content_hash text;
+alter table documents add column if not exists source_version int;
+alter table documents add column if not exists deleted_at timestamptz;
+
+-- Backfill rows uploaded before versioning, then drop their duplicates
+update documents set
+  source = coalesce(source, metadata->>'source'),
+  section = coalesce(section, metadata->>'section'),
+  content_hash = coalesce(content_hash, encode(sha256(convert_to(content, 'UTF8')), 'hex'))
+where content_hash is null;
+
+delete from documents d
+using documents keep
+where d.source is not distinct from keep.source
+  and d.content_hash = keep.content_hash
+  and d.id > keep.id;
+
+create unique index if not exists documents_source_hash_idx on documents (source, content_hash);
+
+-- One row per uploaded source: bumped whenever any of its chunks change
+create table if not exists document_sources (
+  source text primary key,
+  version int not null default 0,
+  file_hash text,
+  live_chunks int,
+  updated_at timestamptz default now()
+);
+
+-- Approximate nearest-neighbour index for cosine distance over live chunks
+-- only, so tombstones never cost anything at search time
+drop index if exists documents_embedding_hnsw_idx;
+create index if not exists documents_embedding_live_hnsw_idx
+  on documents using hnsw (embedding vector_cosine_ops)
+  with (m = 16, ef_construction = 64)
+  where deleted_at is null;
+
+-- Containment filters on metadata (source, section)
+create index if not exists documents_metadata_idx
+  on documents using gin (metadata jsonb_path_ops);
+
+-- Replaces the original 3-argument version and the one whose filter
+-- argument was named `filter` (renaming a parameter needs a drop)
+drop function if exists match_documents(vector, float, int);
+drop function if exists match_documents(vector, float, int, jsonb);
+
+-- Create a function to search for documents.
+-- The inner query orders by distance alone so the HNSW index can serve it;
+-- the similarity threshold is applied to those candidates afterwards.
+-- `metadata_filter` restricts results by metadata, e.g. '{"section": "Methodology"}'.
+-- Tombstoned chunks are excluded, matching the partial HNSW index.
 create or replace function match_documents (
   query_embedding vector(768),
   match_threshold float,
-  match_count int
+  match_count int,
+  metadata_filter jsonb default '{}'
 )
 returns table (
   id bigint,
   content text,
   metadata jsonb,
-  similarity float
+  similarity float,
+  query_ms float
 )
 language plpgsql
+stable
 as $$
+declare
+  started_at timestamptz := clock_timestamp();
 begin
   return query
+  with nearest as (
+    select
+      d.id,
+      d.content,
+      d.metadata,
+      d.embedding <=> query_embedding as distance
+    from documents d
+    where d.deleted_at is null
+      and (metadata_filter = '{}'::jsonb or d.metadata @> metadata_filter)
+    order by d.embedding <=> query_embedding
+    limit match_count
+  )
   select
-    documents.id,
-    documents.content,
-    documents.metadata,
-    1 - (documents.embedding <=> query_embedding) as similarity
-  from documents
-  where 1 - (documents.embedding <=> query_embedding) > match_threshold
-  order by documents.embedding <=> query_embedding
-  limit match_count;
+    n.id,
+    n.content,
+    n.metadata,
+    1 - n.distance as similarity,
+    (extract(epoch from clock_timestamp() - started_at) * 1000)::float8 as query_ms
+  from nearest n
+  where 1 - n.distance > match_threshold
+  order by n.distance;
+end;
+$$;
+
+-- Recent incidents per ZIP: lets "order by report_dat desc limit N" stop after N rows
+create index if not exists idx_crimes_zip_report_dat on crimes (zip_code, report_dat desc);
+
+-- Per-ZIP crime aggregates maintained by the loader, so every API read is a
+-- primary-key lookup. Superseded the zipcode_crime_summary materialized
+-- view, which had to recount the whole table on each refresh.
+drop function if exists refresh_zipcode_crime_summary();
+drop materialized view if exists zipcode_crime_summary;
+
+create table if not exists zipcode_crime_totals (
+  zip_code text primary key,
+  total_crimes int not null,
+  last_report_dat timestamptz,
+  top_offense text,
+  top_offense_count int,
+  refreshed_at timestamptz not null default now()
+);
+
+create table if not exists zipcode_offense_counts (
+  zip_code text not null,
+  offense text not null,
+  crime_count int not null,
+  primary key (zip_code, offense)
+);
+
+create table if not exists zipcode_shift_counts (
+  zip_code text not null,
+  shift text not null,
+  crime_count int not null,
+  primary key (zip_code, shift)
+);
+
+create table if not exists zipcode_monthly_counts (
+  zip_code text not null,
+  month date not null,
+  crime_count int not null,
+  primary key (zip_code, month)
+);
+
+-- ZIPs whose aggregates are stale. Filled by statement-level triggers on
+-- crimes (old and new ZIP of every touched row), drained by
+-- refresh_zipcode_aggregates(), so a refresh only regroups those ZIPs.
+create table if not exists crime_aggregate_dirty (
+  zip_code text primary key
+);
+
+create or replace function mark_crime_zips_dirty()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if tg_op in ('INSERT', 'UPDATE') then
+    insert into crime_aggregate_dirty (zip_code)
+    select distinct zip_code from new_rows where zip_code is not null
+    on conflict do nothing;
+  end if;
+  if tg_op in ('UPDATE', 'DELETE') then
+    insert into crime_aggregate_dirty (zip_code)
+    select distinct zip_code from old_rows where zip_code is not null
+    on conflict do nothing;
+  end if;
+  return null;
+end;
+$$;
+
+-- Transition tables allow only one event per trigger
+drop trigger if exists crimes_mark_dirty_insert on crimes;
+create trigger crimes_mark_dirty_insert after insert on crimes
+  referencing new table as new_rows
+  for each statement execute function mark_crime_zips_dirty();
+
+drop trigger if exists crimes_mark_dirty_update on crimes;
+create trigger crimes_mark_dirty_update after update on crimes
+  referencing old table as old_rows new table as new_rows
+  for each statement execute function mark_crime_zips_dirty();
+
+drop trigger if exists crimes_mark_dirty_delete on crimes;
+create trigger crimes_mark_dirty_delete after delete on crimes
+  referencing old table as old_rows
+  for each statement execute function mark_crime_zips_dirty();
+
+-- Called by the pipeline's refresh_aggregates stage (scripts/refresh_aggregates.py)
+-- after each crime load. Regroups only the dirty ZIPs, each through
+-- idx_crimes_zip_report_dat, and returns how many ZIPs were refreshed.
+create or replace function refresh_zipcode_aggregates()
+returns int
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+  dirty text[];
+begin
+  with claimed as (
+    delete from crime_aggregate_dirty returning zip_code
+  )
+  select array_agg(zip_code) into dirty from claimed;
+
+  if dirty is null then
+    return 0;
+  end if;
+
+  delete from zipcode_offense_counts where zip_code = any(dirty);
+  insert into zipcode_offense_counts (zip_code, offense, crime_count)
+  select zip_code, coalesce(offense, 'UNKNOWN'), count(*)
+  from crimes
+  where zip_code = any(dirty)
+  group by 1, 2;
+
+  delete from zipcode_shift_counts where zip_code = any(dirty);
+  insert into zipcode_shift_counts (zip_code, shift, crime_count)
+  select zip_code, coalesce(shift, 'UNKNOWN'), count(*)
+  from crimes
+  where zip_code = any(dirty)
+  group by 1, 2;
+
+  delete from zipcode_monthly_counts where zip_code = any(dirty);
+  insert into zipcode_monthly_counts (zip_code, month, crime_count)
+  select zip_code, date_trunc('month', report_dat at time zone 'UTC')::date, count(*)
+  from crimes
+  where zip_code = any(dirty) and report_dat is not null
+  group by 1, 2;
+
+  delete from zipcode_crime_totals where zip_code = any(dirty);
+  insert into zipcode_crime_totals (zip_code, total_crimes, last_report_dat, top_offense, top_offense_count, refreshed_at)
+  select c.zip_code, count(*), max(c.report_dat), top.offense, top.crime_count, now()
+  from crimes c
+  left join lateral (
+    select o.offense, o.crime_count
+    from zipcode_offense_counts o
+    where o.zip_code = c.zip_code
+    order by o.crime_count desc, o.offense
+    limit 1
+  ) top on true
+  where c.zip_code = any(dirty)
+  group by c.zip_code, top.offense, top.crime_count;
+
+  perform sync_zipcode_stats(dirty);
+  return array_length(dirty, 1);
+end;
+$$;
+
+-- Per-ZIP indices uploaded by scripts/upload_stats.py
+create table if not exists zipcode_stats (
+  zip_code text primary key,
+  total_crimes int,
+  avg_price float,
+  safety_index float,
+  affordability_index float,
+  quality_of_life_index float,
+  investment_index float,
+  crime_index float,
+  top_crime_type text,
+  updated_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- Copies crime totals into zipcode_stats (whose index columns come from
+-- scripts/upload_stats.py); null = every ZIP
+create or replace function sync_zipcode_stats(zips text[] default null)
+returns void
+language sql
+security definer
+set search_path = public
+as $$
+  update zipcode_stats s set
+    total_crimes = t.total_crimes,
+    top_crime_type = t.top_offense
+  from zipcode_crime_totals t
+  where s.zip_code = t.zip_code
+    and (zips is null or t.zip_code = any(zips));
+$$;
+
+-- First run: everything is dirty
+insert into crime_aggregate_dirty (zip_code)
+select distinct zip_code from crimes where zip_code is not null
+on conflict do nothing;
+
+-- Single-row summary for /api/stats/summary, refreshed after each load
+create table if not exists stats_summary (
+  id int primary key default 1 check (id = 1),
+  total_crimes int not null default 0,
+  total_zillow_regions int not null default 0,
+  refreshed_at timestamptz not null default now()
+);
+
+create or replace function refresh_stats_summary()
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  insert into stats_summary (id, total_crimes, total_zillow_regions, refreshed_at)
+  values (
+    1,
+    -- Every row of crimes, as before: the per-ZIP totals plus the rows without
+    -- a ZIP (idx_crimes_zip_report_dat also indexes the null zip_code rows)
+    (select coalesce(sum(total_crimes), 0) from zipcode_crime_totals)
+      + (select count(*) from crimes where zip_code is null),
+    (select count(*) from zillow_data),
+    now()
+  )
+  on conflict (id) do update set
+    total_crimes = excluded.total_crimes,
+    total_zillow_regions = excluded.total_zillow_regions,
+    refreshed_at = excluded.refreshed_at;
+end;
+$$;
+
+-- The security definer functions above bypass RLS; keep them off the public
+-- PostgREST RPC surface. The loaders call them with the service_role key
+-- (or over DATABASE_URL with UPLOAD_LOADER=copy).
+do $$
+begin
+  revoke execute on function mark_crime_zips_dirty() from public;
+  revoke execute on function refresh_zipcode_aggregates() from public;
+  revoke execute on function sync_zipcode_stats(text[]) from public;
+  revoke execute on function refresh_stats_summary() from public;
+  if exists (select from pg_roles where rolname = 'anon') then
+    revoke execute on function mark_crime_zips_dirty() from anon, authenticated;
+    revoke execute on function refresh_zipcode_aggregates() from anon, authenticated;
+    revoke execute on function sync_zipcode_stats(text[]) from anon, authenticated;
+    revoke execute on function refresh_stats_summary() from anon, authenticated;
+  end if;
+  if exists (select from pg_roles where rolname = 'service_role') then
+    grant execute on function refresh_zipcode_aggregates() to service_role;
+    grant execute on function sync_zipcode_stats(text[]) to service_role;
+    grant execute on function refresh_stats_summary() to service_role;
+  end if;
 end;
 $$;
@@ -0,0 +1,178 @@
+"""
+In-memory per-ZIP snapshot of the pipeline output.
+
+The combined JSON written by scripts/process_data.py (stats, indices, HCI
+indicators, zillow, census and recent crimes per ZIP) is loaded once into an
+immutable Snapshot. A background task polls the file's mtime and swaps in a
+freshly loaded Snapshot when a new artifact version appears, so request
+handlers never touch the database for these reads.
+
+When the pipeline's crime CSV is present, the snapshot also carries a
+spatial index over the incident coordinates (spatial_index.CrimeIndex) for
+radius and bounding-box queries; it is versioned and swapped together with
+the per-ZIP data.
+"""
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+
+try:
+    from backend.spatial_index import CrimeIndex, load_crime_index
+except ImportError:
+    from spatial_index import CrimeIndex, load_crime_index
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SNAPSHOT_PATH = os.path.join(PROJECT_ROOT, "dc_crime_zillow_combined.json")
+DEFAULT_CRIME_POINTS_PATH = os.path.join(PROJECT_ROOT, "DC_Crime_Incidents_in_2025_with_zipcode.csv")
+
+# Per-ZIP fields kept in the snapshot bundle
+BUNDLE_FIELDS = (
+    "zillow_data", "census_data", "crime_stats", "indices", "hci",
+    "recent_crimes", "housing_trends",
+)
+# An artifact without these (e.g. from the legacy combine_data_to_json.py)
+# would silently serve empty crime data. recent_crimes is optional: older
+# artifacts lack it and the API fetches those rows with one bounded query.
+REQUIRED_FIELDS = ("crime_stats",)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: str
+    loaded_at: datetime
+    metadata: Mapping[str, Any]
+    zipcodes: Mapping[str, Mapping[str, Any]]
+    crimes: Optional[CrimeIndex] = None
+
+    def get(self, zipcode: str) -> Optional[Mapping[str, Any]]:
+        return self.zipcodes.get(zipcode)
+
+
+def file_version(path: str) -> Optional[str]:
+    """Cheap version stamp for the artifact: mtime (ns) and size"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def load_snapshot(path: str, version: Optional[str] = None, crimes_path: Optional[str] = None) -> Snapshot:
+    """Read the combined JSON (and index the crime CSV, if any) and freeze it into a Snapshot"""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+
+    zipcodes = {}
+    for zip_code, info in raw.get("data", {}).items():
+        missing = [key for key in REQUIRED_FIELDS if key not in info]
+        if missing:
+            raise ValueError(f"ZIP {zip_code} lacks {', '.join(missing)}; "
+                             f"rebuild {os.path.basename(path)} with scripts/process_data.py")
+        bundle = {"zip_code": info.get("zip_code", zip_code)}
+        for key in BUNDLE_FIELDS:
+            if key in info:
+                bundle[key] = info[key]
+        zipcodes[str(zip_code)] = MappingProxyType(bundle)
+
+    return Snapshot(
+        version=version or file_version(path) or "unknown",
+        loaded_at=datetime.now(timezone.utc),
+        metadata=MappingProxyType(raw.get("metadata", {})),
+        zipcodes=MappingProxyType(zipcodes),
+        crimes=load_crime_index(crimes_path) if crimes_path and os.path.exists(crimes_path) else None,
+    )
+
+
+def to_plain(value: Any) -> Any:
+    """Convert read-only mappings back into dicts for JSON responses"""
+    if isinstance(value, Mapping):
+        return {k: to_plain(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [to_plain(v) for v in value]
+    return value
+
+
+class SnapshotStore:
+    """
+    Holds the current Snapshot and replaces it atomically when the artifact
+    changes. Readers just take `store.current`; a reload builds the new
+    Snapshot off to the side and swaps the reference in a single assignment.
+    """
+
+    def __init__(self, path: str, check_interval: float = 30.0, crimes_path: Optional[str] = None):
+        self.path = path
+        self.crimes_path = crimes_path
+        self.check_interval = check_interval
+        self._current: Optional[Snapshot] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[Snapshot]:
+        return self._current
+
+    @property
+    def version(self) -> Optional[str]:
+        snapshot = self._current
+        return snapshot.version if snapshot else None
+
+    def get(self, zipcode: str) -> Optional[Mapping[str, Any]]:
+        snapshot = self._current
+        return snapshot.get(zipcode) if snapshot else None
+
+    @property
+    def crimes(self) -> Optional[CrimeIndex]:
+        snapshot = self._current
+        return snapshot.crimes if snapshot else None
+
+    def artifact_version(self) -> Optional[str]:
+        version = file_version(self.path)
+        if version is None or not self.crimes_path:
+            return version
+        return f"{version}+{file_version(self.crimes_path) or 'none'}"
+
+    def reload_if_changed(self) -> bool:
+        """Load the artifacts if their version differs from the one being served"""
+        with self._reload_lock:
+            version = self.artifact_version()
+            if version is None or version == self.version:
+                return False
+            try:
+                snapshot = load_snapshot(self.path, version, self.crimes_path)
+            except (OSError, ValueError) as e:
+                # Keep serving the previous snapshot if the new file is unreadable
+                # (e.g. caught mid-write); the next poll retries.
+                print(f"⚠️ Snapshot reload failed for {self.path}: {e}")
+                return False
+            self._current = snapshot
+            points = f", {len(snapshot.crimes)} indexed incidents" if snapshot.crimes is not None else ""
+            print(f"📦 Loaded snapshot {snapshot.version} ({len(snapshot.zipcodes)} ZIP codes{points})")
+            return True
+
+    async def watch(self):
+        """Poll the artifact and hot-reload it; run as a background task"""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await asyncio.to_thread(self.reload_if_changed)
+
+    def status(self) -> Dict[str, Any]:
+        snapshot = self._current
+        return {
+            "path": self.path,
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+            "generated_at": snapshot.metadata.get("generated_at") if snapshot else None,
+            "zipcodes": len(snapshot.zipcodes) if snapshot else 0,
+            "crime_points": len(snapshot.crimes) if snapshot and snapshot.crimes is not None else 0,
+        }
+
+
+snapshot_store = SnapshotStore(
+    os.getenv("SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH),
+    check_interval=float(os.getenv("SNAPSHOT_RELOAD_INTERVAL", "30")),
+    crimes_path=os.getenv("CRIME_POINTS_PATH", DEFAULT_CRIME_POINTS_PATH),
+)
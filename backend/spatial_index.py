@@ -0,0 +1,211 @@
+"""
+In-memory spatial index over crime incident coordinates.
+
+Incidents are projected onto a local plane in meters (equirectangular
+around the data's mean latitude) and bucketed into a uniform grid of CELL_METERS cells. Points are
+stored sorted by row-major cell id, so every grid row a query touches is
+one contiguous slice found with two binary searches. A radius or bounding
+box query therefore reads a few small slices of numpy arrays and filters
+them exactly (great-circle distance for radius queries), instead of
+scanning every incident.
+"""
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_M = 6_371_008.8
+CELL_METERS = 250.0
+NO_TIMESTAMP = np.iinfo(np.int64).min
+POINT_COLUMNS = ["CCN", "LATITUDE", "LONGITUDE", "OFFENSE", "REPORT_DAT", "SHIFT", "BLOCK"]
+
+
+def haversine_m(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    h = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(h))
+
+
+@dataclass(frozen=True)
+class CrimeIndex:
+    lat0: float
+    lon0: float
+    origin: Tuple[float, float]  # (x, y) of the grid's lower-left corner, meters
+    nx: int
+    ny: int
+    cell_ids: np.ndarray  # sorted, one per point
+    x: np.ndarray
+    y: np.ndarray
+    lat: np.ndarray
+    lon: np.ndarray
+    report_ts: np.ndarray  # epoch seconds, NO_TIMESTAMP when unknown
+    offense: np.ndarray  # codes into `offenses`
+    offenses: Tuple[str, ...]
+    ccn: np.ndarray
+    shift: np.ndarray
+    block: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.cell_ids)
+
+    def latest_report(self) -> Optional[datetime]:
+        ts = int(self.report_ts.max()) if len(self.report_ts) else NO_TIMESTAMP
+        return datetime.fromtimestamp(ts, timezone.utc) if ts != NO_TIMESTAMP else None
+
+    def project(self, lat, lon) -> Tuple[Any, Any]:
+        scale = np.pi / 180.0 * EARTH_RADIUS_M
+        return (np.asarray(lon) - self.lon0) * scale * np.cos(np.radians(self.lat0)), (np.asarray(lat) - self.lat0) * scale
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return (int(np.clip((x - self.origin[0]) // CELL_METERS, 0, self.nx - 1)),
+                int(np.clip((y - self.origin[1]) // CELL_METERS, 0, self.ny - 1)))
+
+    def _candidates(self, x0: float, y0: float, x1: float, y1: float) -> np.ndarray:
+        """Indices of the points in every grid cell overlapping the box (one slice per grid row)"""
+        if x1 < self.origin[0] or y1 < self.origin[1]:
+            return np.empty(0, dtype=np.int64)
+        cx0, cy0 = self._cell(x0, y0)
+        cx1, cy1 = self._cell(x1, y1)
+        rows = np.arange(cy0, cy1 + 1, dtype=np.int64) * self.nx
+        starts = np.searchsorted(self.cell_ids, rows + cx0, side="left")
+        stops = np.searchsorted(self.cell_ids, rows + cx1, side="right")
+        slices = [np.arange(a, b) for a, b in zip(starts, stops) if b > a]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def _filter_time(self, idx: np.ndarray, since: Optional[datetime], until: Optional[datetime]) -> np.ndarray:
+        if since is None and until is None:
+            return idx
+        ts = self.report_ts[idx]
+        keep = ts != NO_TIMESTAMP
+        if since is not None:
+            keep &= ts >= int(since.timestamp())
+        if until is not None:
+            keep &= ts < int(until.timestamp())
+        return idx[keep]
+
+    def _filter_offense(self, idx: np.ndarray, offense: Optional[str]) -> np.ndarray:
+        if not offense:
+            return idx
+        try:
+            code = self.offenses.index(offense.upper())
+        except ValueError:
+            return idx[:0]
+        return idx[self.offense[idx] == code]
+
+    def near(self, lat: float, lon: float, radius: float, since: Optional[datetime] = None,
+             until: Optional[datetime] = None, offense: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """Incidents within `radius` meters, with counts by offense and the `limit` nearest"""
+        start = time.perf_counter()
+        x, y = self.project(lat, lon)
+        # The plane is only exact at lat0: pad the candidate box, then measure great-circle distance
+        pad = radius * 1.01 + 1.0
+        idx = self._candidates(x - pad, y - pad, x + pad, y + pad)
+        idx = self._filter_offense(self._filter_time(idx, since, until), offense)
+        distance = haversine_m(lat, lon, self.lat[idx], self.lon[idx])
+        inside = distance <= radius
+        idx, distance = idx[inside], distance[inside]
+
+        if len(idx) > limit:
+            nearest = np.argpartition(distance, limit)[:limit]
+        else:
+            nearest = np.arange(len(idx))
+        nearest = nearest[np.argsort(distance[nearest], kind="stable")]
+        incidents = self.incidents(idx[nearest])
+        for incident, meters in zip(incidents, distance[nearest]):
+            incident["distance_m"] = round(float(meters), 1)
+        return self._result(idx, incidents, start)
+
+    def within(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               since: Optional[datetime] = None, until: Optional[datetime] = None,
+               offense: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """Incidents inside a lat/lon bounding box, with counts by offense and the `limit` most recent"""
+        start = time.perf_counter()
+        x0, y0 = self.project(min_lat, min_lon)
+        x1, y1 = self.project(max_lat, max_lon)
+        idx = self._candidates(float(x0), float(y0), float(x1), float(y1))
+        lat, lon = self.lat[idx], self.lon[idx]
+        idx = idx[(lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)]
+        idx = self._filter_offense(self._filter_time(idx, since, until), offense)
+
+        ts = self.report_ts[idx]
+        recent = np.argpartition(-ts, limit)[:limit] if len(idx) > limit else np.arange(len(idx))
+        recent = recent[np.argsort(-ts[recent], kind="stable")]
+        return self._result(idx, self.incidents(idx[recent]), start)
+
+    def _result(self, idx: np.ndarray, incidents: List[Dict[str, Any]], start: float) -> Dict[str, Any]:
+        counts = np.bincount(self.offense[idx], minlength=len(self.offenses))
+        by_offense = {self.offenses[code]: int(counts[code]) for code in np.argsort(-counts, kind="stable") if counts[code]}
+        return {
+            "count": int(len(idx)),
+            "by_offense": by_offense,
+            "incidents": incidents,
+            "query_ms": round((time.perf_counter() - start) * 1000, 3),
+        }
+
+    def incidents(self, idx: np.ndarray) -> List[Dict[str, Any]]:
+        rows = []
+        for i in idx:
+            ts = self.report_ts[i]
+            rows.append({
+                "ccn": self.ccn[i],
+                "offense": self.offenses[self.offense[i]],
+                "report_dat": (datetime.fromtimestamp(int(ts), timezone.utc).isoformat()
+                               if ts != NO_TIMESTAMP else None),
+                "shift": self.shift[i],
+                "block": self.block[i],
+                "latitude": float(self.lat[i]),
+                "longitude": float(self.lon[i]),
+            })
+        return rows
+
+
+def build_index(frame: pd.DataFrame) -> CrimeIndex:
+    """Build the grid from a frame with POINT_COLUMNS"""
+    lat = pd.to_numeric(frame["LATITUDE"], errors="coerce").to_numpy(dtype=np.float64)
+    lon = pd.to_numeric(frame["LONGITUDE"], errors="coerce").to_numpy(dtype=np.float64)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180) & ((lat != 0) | (lon != 0))
+    frame = frame[valid]
+    lat, lon = lat[valid], lon[valid]
+
+    lat0 = float(lat.mean()) if len(lat) else 0.0
+    lon0 = float(lon.mean()) if len(lon) else 0.0
+    scale = np.pi / 180.0 * EARTH_RADIUS_M
+    x = (lon - lon0) * scale * np.cos(np.radians(lat0))
+    y = (lat - lat0) * scale
+    origin = (float(x.min()) if len(x) else 0.0, float(y.min()) if len(y) else 0.0)
+    gx = ((x - origin[0]) // CELL_METERS).astype(np.int64)
+    gy = ((y - origin[1]) // CELL_METERS).astype(np.int64)
+    nx = int(gx.max()) + 1 if len(gx) else 1
+    ny = int(gy.max()) + 1 if len(gy) else 1
+    cell_ids = gy * nx + gx
+    order = np.argsort(cell_ids, kind="stable")
+
+    reported = pd.to_datetime(frame["REPORT_DAT"], errors="coerce", utc=True)
+    report_ts = np.where(reported.isna(), NO_TIMESTAMP,
+                         reported.to_numpy(dtype="datetime64[s]", na_value=np.datetime64(0, "s")).astype(np.int64))
+    offense_codes, offenses = pd.factorize(frame["OFFENSE"].fillna("UNKNOWN").str.upper(), sort=True)
+
+    def text(column: str) -> np.ndarray:
+        return frame[column].astype(object).where(frame[column].notna(), None).to_numpy()[order]
+
+    return CrimeIndex(
+        lat0=lat0, lon0=lon0, origin=origin, nx=nx, ny=ny,
+        cell_ids=cell_ids[order],
+        x=x[order], y=y[order], lat=lat[order], lon=lon[order],
+        report_ts=report_ts[order],
+        offense=offense_codes[order].astype(np.int16),
+        offenses=tuple(offenses),
+        ccn=text("CCN"), shift=text("SHIFT"), block=text("BLOCK"),
+    )
+
+
+def load_crime_index(path: str) -> CrimeIndex:
+    """Read the crime CSV written by the pipeline and index it"""
+    frame = pd.read_csv(path, usecols=lambda c: c in POINT_COLUMNS, dtype={"CCN": str})
+    for column in POINT_COLUMNS:
+        if column not in frame.columns:
+            frame[column] = None
+    return build_index(frame)
@@ -0,0 +1,159 @@
+"""
+In-process vector index over the knowledge-base `documents` table.
+
+The knowledge base is a few dozen paper chunks, so the backend keeps every
+chunk embedding in one L2-normalized float32 matrix and answers top-k with a
+single matrix-vector product instead of a match_documents round trip.
+pgvector stays the source of truth: a background task compares a cheap
+version stamp of the table and reloads the matrix when it changes.
+"""
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from backend.db import get_supabase
+except ImportError:
+    from db import get_supabase
+
+PAGE_SIZE = 500
+
+
+@dataclass(frozen=True)
+class IndexData:
+    version: str
+    matrix: np.ndarray  # (n, dims), rows L2-normalized
+    rows: Tuple[Dict[str, Any], ...]
+
+
+def parse_embedding(value) -> np.ndarray:
+    """pgvector comes back through PostgREST as a '[0.1,0.2,...]' string"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def documents_version() -> Optional[str]:
+    """
+    Live row count + highest id + per-source versions: changes whenever chunks
+    are added, tombstoned or revived by the knowledge-base loader
+    """
+    supabase = get_supabase()
+    response = (
+        supabase.table("documents").select("id", count="exact")
+        .is_("deleted_at", "null").order("id", desc=True).limit(1).execute()
+    )
+    max_id = response.data[0]["id"] if response.data else 0
+    sources = supabase.table("document_sources").select("source, version").order("source").execute().data or []
+    source_versions = ",".join(f"{row['source']}:{row['version']}" for row in sources)
+    return f"{response.count}-{max_id}-{source_versions}"
+
+
+def load_documents() -> List[Dict[str, Any]]:
+    rows, start = [], 0
+    while True:
+        page = (
+            get_supabase().table("documents")
+            .select("id, content, metadata, embedding")
+            .is_("deleted_at", "null")
+            .order("id")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows.extend(page.data or [])
+        if not page.data or len(page.data) < PAGE_SIZE:
+            return rows
+        start += PAGE_SIZE
+
+
+def build_index(version: str, documents: List[Dict[str, Any]]) -> IndexData:
+    documents = [d for d in documents if d.get("embedding") is not None]
+    if not documents:
+        return IndexData(version, np.zeros((0, 0), dtype=np.float32), ())
+
+    matrix = np.vstack([parse_embedding(d["embedding"]) for d in documents])
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    rows = tuple({"id": d["id"], "content": d["content"], "metadata": d.get("metadata")} for d in documents)
+    return IndexData(version, matrix, rows)
+
+
+class VectorIndex:
+    def __init__(self, fetch_version: Callable[[], Optional[str]] = documents_version,
+                 fetch_documents: Callable[[], List[Dict[str, Any]]] = load_documents,
+                 sync_interval: float = 300.0):
+        self.fetch_version = fetch_version
+        self.fetch_documents = fetch_documents
+        self.sync_interval = sync_interval
+        self._data: Optional[IndexData] = None
+        self._sync_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        data = self._data
+        return data is not None and len(data.rows) > 0
+
+    def sync(self) -> bool:
+        """Reload from pgvector if the table's version stamp changed"""
+        with self._sync_lock:
+            try:
+                version = self.fetch_version()
+                if version is None or (self._data is not None and self._data.version == version):
+                    return False
+                data = build_index(version, self.fetch_documents())
+            except Exception as e:
+                print(f"⚠️ Document index sync failed: {e}")
+                return False
+            self._data = data
+            print(f"📚 Loaded document index {version} ({len(data.rows)} chunks)")
+            return True
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await asyncio.to_thread(self.sync)
+
+    def search(self, query_embedding, match_count: int = 3, match_threshold: float = 0.0,
+               filter: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Top-k chunks by cosine similarity, same shape as the match_documents RPC.
+        `filter` keeps only chunks whose metadata contains every given key/value.
+        """
+        data = self._data
+        if data is None or not data.rows:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0 or query.shape[0] != data.matrix.shape[1]:
+            return []
+
+        scores = data.matrix @ (query / norm)
+        if filter:
+            keep = np.array([
+                all((row["metadata"] or {}).get(k) == v for k, v in filter.items())
+                for row in data.rows
+            ])
+            scores = np.where(keep, scores, -np.inf)
+        k = min(match_count, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**data.rows[i], "similarity": float(scores[i])}
+            for i in top if scores[i] > match_threshold
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        data = self._data
+        return {
+            "version": data.version if data else None,
+            "chunks": len(data.rows) if data else 0,
+        }
+
+
+document_index = VectorIndex(sync_interval=float(os.getenv("DOCUMENT_INDEX_SYNC_INTERVAL", "300")))
@@ -1,8 +1,8 @@
 // Angular Service 範例：讀取 GCP Storage JSON 資料
 import { Injectable } from '@angular/core';
 import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
-import { map } from 'rxjs/operators';
+import { Observable, of } from 'rxjs';
+import { map, shareReplay, switchMap } from 'rxjs/operators';
 
 export interface ZipCodeData {
   zip_code: string;
@@ -19,7 +19,10 @@ export interface ZipCodeData {
     by_shift: { [key: string]: number };
     by_ward: { [key: string]: number };
   };
-  crimes: any[];
+  indices?: { [name: string]: number | null };
+  hci?: { [key: string]: any };
+  // frontend_data.json 不含案件明細；近期案件請用 getZipShard(zip).recent_crimes
+  crimes?: any[];
 }
 
 export interface CombinedData {
@@ -32,20 +35,131 @@ export interface CombinedData {
   data: { [zipCode: string]: ZipCodeData };
 }
 
+export interface DataManifest {
+  version: string;
+  previous_version: string | null;
+  published_at: string;
+  shards_prefix?: string;
+  files: { [fileName: string]: { path: string; sha256: string; bytes: number } };
+}
+
+// scripts/build_shards.py: 地圖初次繪製只需要 index，細節頁只讀一個 ZIP 的 shard
+export interface ZipIndexEntry {
+  hci: number | null;
+  growth: number | null;
+  safety: number | null;
+  crime_rate: number | null;
+  crimes: number;
+  price: number | null;
+  mom: number | null;
+  yoy: number | null;
+  shard: string;
+}
+
+export interface ZipIndex {
+  generated_at: string;
+  total_zipcodes: number;
+  total_crimes: number;
+  index_ranges: { [name: string]: { min: number; max: number } };
+  hci_ranges: { [name: string]: number };
+  zips: { [zipCode: string]: ZipIndexEntry };
+}
+
+export interface ZipShard {
+  zip_code: string;
+  zillow_data: ZipCodeData['zillow_data'];
+  census_data: { [key: string]: number | null };
+  crime_stats: ZipCodeData['crime_stats'];
+  indices: { [name: string]: number | null };
+  hci: { [key: string]: any };
+  recent_crimes: any[];
+}
+
 @Injectable({
   providedIn: 'root'
 })
 export class CrimeZillowDataService {
   // GCP Storage 公開 URL
-  private readonly DATA_URL = 'https://storage.googleapis.com/dc-crime-data-zhangxuanqi-1762814591/data/dc_crime_zillow_combined.json';
+  private readonly BUCKET_URL = 'https://storage.googleapis.com/dc-crime-data-zhangxuanqi-1762814591/';
+  // manifest.json 指向目前版本的檔案（以內容雜湊命名，可永久快取）；只有 manifest 需要重新驗證
+  private readonly MANIFEST_URL = this.BUCKET_URL + 'data/manifest.json';
+  // pipeline 的 upload_gcs 發佈的檔名（scripts/upload_to_gcp_storage.py 預設值）
+  private readonly DATA_FILE = 'frontend_data.json';
+  // manifest 快取多久後重新驗證；檔案以雜湊命名，新版本只會重新下載有變的檔案
+  private readonly MANIFEST_TTL_MS = 5 * 60 * 1000;
+
+  private manifest$?: Observable<DataManifest>;
+  private manifestFetchedAt = 0;
+  // 以 manifest 中的檔案路徑（含內容雜湊）為 key，版本變了才重新下載
+  private data?: { path: string; data$: Observable<CombinedData> };
+  private index?: { path: string; data$: Observable<ZipIndex> };
 
   constructor(private http: HttpClient) {}
 
+  /**
+   * 取得目前發佈版本的 manifest（超過 MANIFEST_TTL_MS 或呼叫 refresh() 後重新讀取）
+   */
+  getManifest(): Observable<DataManifest> {
+    if (!this.manifest$ || Date.now() - this.manifestFetchedAt > this.MANIFEST_TTL_MS) {
+      this.manifestFetchedAt = Date.now();
+      this.manifest$ = this.http.get<DataManifest>(this.MANIFEST_URL, {
+        headers: { 'Cache-Control': 'no-cache' }
+      }).pipe(shareReplay(1));
+    }
+    return this.manifest$;
+  }
+
+  /**
+   * 立即重新檢查是否有新版本（例如分頁回到前景時）
+   */
+  refresh(): void {
+    this.manifest$ = undefined;
+  }
+
+  /**
+   * 取得 ZIP 索引（HCI 指標、犯罪數、房價與各 ZIP 的 shard 檔名）
+   */
+  getIndex(): Observable<ZipIndex> {
+    return this.getManifest().pipe(
+      switchMap(manifest => {
+        const path = manifest.files['index.json'].path;
+        if (this.index?.path !== path) {
+          this.index = { path, data$: this.http.get<ZipIndex>(this.BUCKET_URL + path).pipe(shareReplay(1)) };
+        }
+        return this.index.data$;
+      })
+    );
+  }
+
+  /**
+   * 取得單一 ZIP 的詳細資料（只下載該 ZIP 的 shard）
+   */
+  getZipShard(zipCode: string): Observable<ZipShard | null> {
+    return this.getManifest().pipe(
+      switchMap(manifest => this.getIndex().pipe(
+        switchMap(index => {
+          const entry = index.zips[zipCode];
+          return entry
+            ? this.http.get<ZipShard>(this.BUCKET_URL + (manifest.shards_prefix ?? 'data/shards/') + entry.shard)
+            : of(null);
+        })
+      ))
+    );
+  }
+
   /**
    * 取得所有資料
    */
   getAllData(): Observable<CombinedData> {
-    return this.http.get<CombinedData>(this.DATA_URL);
+    return this.getManifest().pipe(
+      switchMap(manifest => {
+        const path = manifest.files[this.DATA_FILE]?.path ?? 'data/' + this.DATA_FILE;
+        if (this.data?.path !== path) {
+          this.data = { path, data$: this.http.get<CombinedData>(this.BUCKET_URL + path).pipe(shareReplay(1)) };
+        }
+        return this.data.data$;
+      })
+    );
   }
 
   /**
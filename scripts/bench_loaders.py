@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Compare rows/sec for loading crimes through PostgREST (JSON upserts on the
+batch engine in scripts/lib/batch_upload.py) and through COPY into a staging
+table + one merge (scripts/lib/pg_copy.py).
+
+The COPY path only needs DATABASE_URL, so it can be measured against a local
+Postgres that has the crimes table from upload_to_supabase.py's setup SQL.
+The PostgREST path runs only when SUPABASE_URL / SUPABASE_KEY are set.
+
+Usage: python scripts/bench_loaders.py [--csv DC_Crime_Incidents_2025_08_09_with_zipcode.csv] [--repeat 3]
+"""
+import os
+import sys
+import argparse
+
+from dotenv import load_dotenv
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.lib import pg_copy, batch_upload
+from scripts.lib.records import JsonColumns
+from scripts.upload_to_supabase import prepare_crime_frame
+
+
+def bench_rest(frame):
+    from supabase import create_client
+    supabase = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    result = batch_upload.upload_batches(
+        JsonColumns(frame),
+        batch_upload.postgrest_upsert(supabase, 'crimes', 'ccn'),
+        label='crimes', progress=False
+    )
+    return pg_copy.LoadStats('crimes', result.uploaded, result.seconds)
+
+
+def bench_copy(frame):
+    return pg_copy.copy_merge(frame, 'crimes', ['ccn'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PostgREST vs COPY loading")
+    parser.add_argument("--csv", default="DC_Crime_Incidents_2025_08_09_with_zipcode.csv", help="Crime CSV with ZIP_CODE")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per loader")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv('SUPABASE_URL'):
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env'))
+
+    frame = prepare_crime_frame(args.csv)
+    loaders = []
+    if os.getenv('SUPABASE_URL') and os.getenv('SUPABASE_KEY'):
+        loaders.append(("PostgREST upsert", bench_rest))
+    if pg_copy.get_database_url():
+        loaders.append(("COPY + merge", bench_copy))
+    if not loaders:
+        print("Error: set SUPABASE_URL/SUPABASE_KEY and/or DATABASE_URL.")
+        return
+
+    print()
+    for label, run in loaders:
+        runs = [run(frame) for _ in range(args.repeat)]
+        best = max(runs, key=lambda s: s.rows_per_sec)
+        print(f"{label:<18} best of {args.repeat}: {best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Compare per-request latency and open sockets for the Supabase access pattern
+before (create_client per request) and after (shared pooled client from
+backend/db.py).
+
+Usage: python scripts/bench_supabase_client.py [--requests 50] [--zip 20001]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def count_open_sockets():
+    """Number of socket file descriptors held by this process (Linux only)"""
+    fd_dir = "/proc/self/fd"
+    if not os.path.isdir(fd_dir):
+        return None
+    count = 0
+    for fd in os.listdir(fd_dir):
+        try:
+            if os.readlink(os.path.join(fd_dir, fd)).startswith("socket:"):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+def run(label, get_client, n, zip_code):
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        client = get_client()
+        client.table("zipcode_stats").select("zip_code").eq("zip_code", zip_code).execute()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<28} mean {statistics.mean(latencies):7.1f} ms | "
+          f"p50 {statistics.median(latencies):7.1f} ms | p95 {p95:7.1f} ms | "
+          f"open sockets {count_open_sockets()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Supabase client reuse")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--zip", default="20001", help="ZIP code to query")
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv('SUPABASE_URL'):
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env'))
+
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_KEY')
+    if not url or not key:
+        print("Error: Supabase credentials not found.")
+        return
+
+    from backend.db import init_supabase, close_supabase
+
+    print(f"Open sockets at start: {count_open_sockets()}")
+    run("before: client per request", lambda: create_client(url, key), args.requests, args.zip)
+
+    shared = init_supabase()
+    run("after: shared pooled client", lambda: shared, args.requests, args.zip)
+    close_supabase()
+
+
+if __name__ == "__main__":
+    main()
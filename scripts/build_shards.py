@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Split the combined JSON into a compact index and one shard per ZIP.
+
+    shards/index.json                 ZIP -> HCI indicators, crime count, price
+                                      and its shard file, plus the shared ranges
+    shards/zip/<zip>.<hash>.json      crime_stats, census, Zillow, indices, HCI
+                                      and recent crimes for one ZIP
+
+The map only needs the index for its first render; a detail view fetches a
+single shard. Shard names carry a hash of their content, so they can be
+cached forever and only the shards whose ZIP changed are re-uploaded.
+
+Usage: python scripts/build_shards.py [--input dc_crime_zillow_combined.json] [--output-dir shards]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, Optional
+
+SHARD_HASH_LENGTH = 12
+COMPACT = (',', ':')
+# Written only by process_data.py; the legacy combine_data_to_json.py output lacks them
+REQUIRED_FIELDS = ('hci', 'crime_stats', 'recent_crimes')
+
+
+def _round(value: Any, digits: int = 4) -> Any:
+    return round(value, digits) if isinstance(value, float) else value
+
+
+def index_entry(info: Dict[str, Any], shard: str) -> Dict[str, Any]:
+    """The handful of numbers the map colors and sorts by"""
+    hci = (info.get('hci') or {}).get('default') or {}
+    zillow = info.get('zillow_data') or {}
+    return {
+        'hci': _round(hci.get('hci_score_100')),
+        'growth': _round(hci.get('growth_indicator_100')),
+        'safety': _round(hci.get('safety_indicator_100')),
+        'crime_rate': _round(hci.get('crime_rate_per_1000')),
+        'crimes': (info.get('crime_stats') or {}).get('total_crimes', 0),
+        'price': _round(zillow.get('current_price'), 0),
+        'mom': _round(zillow.get('mom')),
+        'yoy': _round(zillow.get('yoy')),
+        'shard': shard,
+    }
+
+
+def shard_payload(info: Dict[str, Any]) -> Dict[str, Any]:
+    hci = info.get('hci') or {}
+    return {
+        'zip_code': info.get('zip_code'),
+        'zillow_data': info.get('zillow_data'),
+        'census_data': info.get('census_data'),
+        'crime_stats': info.get('crime_stats'),
+        'indices': info.get('indices'),
+        'hci': hci.get('default'),
+        'recent_crimes': info.get('recent_crimes', []),
+    }
+
+
+def write_shard(zip_dir: str, zip_code: str, payload: Dict[str, Any]) -> str:
+    data = json.dumps(payload, separators=COMPACT, ensure_ascii=False, default=str).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:SHARD_HASH_LENGTH]
+    name = f"{zip_code}.{digest}.json"
+    with open(os.path.join(zip_dir, name), 'wb') as f:
+        f.write(data)
+    return name
+
+
+def build_shards(input_path: str = 'dc_crime_zillow_combined.json', output_dir: str = 'shards') -> Optional[str]:
+    """Write the index and shards; returns the index path (None if the input is missing or incomplete)"""
+    if not os.path.exists(input_path):
+        print(f"Error: {input_path} not found.")
+        return None
+
+    with open(input_path, 'r', encoding='utf-8') as f:
+        combined = json.load(f)
+    data = combined.get('data', {})
+    metadata = combined.get('metadata', {})
+    if not data:
+        print(f"Error: {input_path} has no ZIP data.")
+        return None
+    incomplete = {zip_code: [key for key in REQUIRED_FIELDS if key not in info]
+                  for zip_code, info in data.items()}
+    incomplete = {zip_code: missing for zip_code, missing in incomplete.items() if missing}
+    if incomplete:
+        zip_code, missing = next(iter(sorted(incomplete.items())))
+        print(f"Error: {len(incomplete)} ZIP codes in {input_path} lack expected fields "
+              f"(e.g. {zip_code}: {', '.join(missing)}). Rebuild it with scripts/process_data.py.")
+        return None
+
+    zip_dir = os.path.join(output_dir, 'zip')
+    os.makedirs(zip_dir, exist_ok=True)
+    # Shards from earlier runs would otherwise be published forever
+    for name in os.listdir(zip_dir):
+        if name.endswith('.json'):
+            os.remove(os.path.join(zip_dir, name))
+
+    zips = {}
+    for zip_code, info in sorted(data.items()):
+        shard = write_shard(zip_dir, zip_code, shard_payload(info))
+        zips[zip_code] = index_entry(info, f"zip/{shard}")
+
+    first = next(iter(data.values()), {})
+    index = {
+        'generated_at': metadata.get('generated_at'),
+        'total_zipcodes': len(zips),
+        'total_crimes': metadata.get('total_crimes'),
+        'index_ranges': metadata.get('index_ranges'),
+        'hci_ranges': (first.get('hci') or {}).get('ranges'),
+        'zips': zips,
+    }
+    index_path = os.path.join(output_dir, 'index.json')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=COMPACT, ensure_ascii=False, default=str)
+
+    shard_bytes = sum(os.path.getsize(os.path.join(zip_dir, n)) for n in os.listdir(zip_dir))
+    print(f"Wrote {index_path} ({os.path.getsize(index_path):,} bytes) "
+          f"and {len(zips)} shards ({shard_bytes:,} bytes, "
+          f"{shard_bytes / max(len(zips), 1):,.0f} per ZIP) from {os.path.getsize(input_path):,} bytes")
+    return index_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the ZIP index and per-ZIP shards")
+    parser.add_argument("--input", default="dc_crime_zillow_combined.json", help="Combined JSON from process_data.py")
+    parser.add_argument("--output-dir", default="shards", help="Directory for index.json and zip/")
+    args = parser.parse_args()
+    if build_shards(args.input, args.output_dir) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Aggregate crime points into a slippy-map tile pyramid for heat maps.
+
+Every incident's LATITUDE/LONGITUDE is projected to Web Mercator once and
+binned to an integer cell at the finest zoom (each tile is split into
+CELLS_PER_TILE x CELLS_PER_TILE cells). Coarser zooms are derived from the
+finer one by shifting the cell coordinates right by one bit and summing, so
+the whole pyramid is a few numpy passes over unique (cell, offense) keys,
+never a loop over points.
+
+Output (compact JSON, one file per non-empty tile):
+
+    tiles/tileset.json        zoom range, cells per tile, offense list,
+                              bounds, tile counts and a content version
+                              (no timestamp: unchanged tiles, unchanged file)
+    tiles/<z>/<x>/<y>.json    {"cell": [...], "offense": [...], "count": [...]}
+                              one entry per non-empty (cell, offense) pair, sorted
+                              by cell; cell = row * cells_per_tile + column and
+                              offense indexes tileset["offenses"]
+
+Usage: python scripts/build_tiles.py [--csv ...with_zipcode.csv] [--min-zoom 10] [--max-zoom 15]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+MIN_ZOOM = 10
+MAX_ZOOM = 15
+CELL_BITS = 6  # 64 x 64 cells per tile
+COMPACT = (',', ':')
+MAX_LATITUDE = 85.05112878
+# Packed keys in reduce_cells are ((gx * world + gy) * n_offenses + offense)
+# with world = 2**(zoom + cell_bits); keep that below 2**63
+MAX_KEY_BITS = 63
+TILESET_NAME = 'tileset.json'
+
+
+def mercator_fractions(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator position as fractions of the world in [0, 1)"""
+    lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    fx = (lon + 180.0) / 360.0
+    fy = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return np.clip(fx, 0.0, np.nextafter(1.0, 0)), np.clip(fy, 0.0, np.nextafter(1.0, 0))
+
+
+def bin_finest(fx: np.ndarray, fy: np.ndarray, offense: np.ndarray, zoom: int, cell_bits: int):
+    """Unique (cell x, cell y, offense) at `zoom` with their counts"""
+    world = 1 << (zoom + cell_bits)
+    gx = (fx * world).astype(np.int64)
+    gy = (fy * world).astype(np.int64)
+    return reduce_cells(gx, gy, offense.astype(np.int64), np.ones(len(gx), dtype=np.int64), world)
+
+
+def reduce_cells(gx, gy, offense, counts, world: int):
+    """Sum `counts` over identical (gx, gy, offense) keys, packed into one int64 so a 1-D sort does it"""
+    n_offenses = int(offense.max()) + 1 if len(offense) else 1
+    keys = (gx * world + gy) * n_offenses + offense
+    unique, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=counts, minlength=len(unique)).astype(np.int64)
+    cells, off = np.divmod(unique, n_offenses)
+    gx, gy = np.divmod(cells, world)
+    return gx, gy, off, summed
+
+
+def build_pyramid(fx, fy, offense, min_zoom: int, max_zoom: int, cell_bits: int) -> Dict[int, tuple]:
+    levels = {max_zoom: bin_finest(fx, fy, offense, max_zoom, cell_bits)}
+    for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+        gx, gy, off, counts = levels[zoom + 1]
+        levels[zoom] = reduce_cells(gx >> 1, gy >> 1, off, counts, 1 << (zoom + cell_bits))
+    return levels
+
+
+def tile_payloads(level: tuple, cell_bits: int):
+    """Yield (tile x, tile y, payload dict) for every non-empty tile of one zoom level"""
+    gx, gy, off, counts = level
+    size = 1 << cell_bits
+    tx, ty = gx >> cell_bits, gy >> cell_bits
+    cell = (gy & (size - 1)) * size + (gx & (size - 1))
+
+    order = np.lexsort((off, cell, ty, tx))
+    tx, ty, cell, off, counts = tx[order], ty[order], cell[order], off[order], counts[order]
+    tile_starts = np.flatnonzero(np.r_[True, (tx[1:] != tx[:-1]) | (ty[1:] != ty[:-1])])
+    tile_stops = np.r_[tile_starts[1:], len(tx)]
+
+    for start, stop in zip(tile_starts, tile_stops):
+        yield int(tx[start]), int(ty[start]), {
+            'cell': cell[start:stop].tolist(),
+            'offense': off[start:stop].tolist(),
+            'count': counts[start:stop].tolist(),
+        }
+
+
+def load_points(csv_path: str) -> pd.DataFrame:
+    frame = pd.read_csv(csv_path, usecols=['LATITUDE', 'LONGITUDE', 'OFFENSE'])
+    frame['LATITUDE'] = pd.to_numeric(frame['LATITUDE'], errors='coerce')
+    frame['LONGITUDE'] = pd.to_numeric(frame['LONGITUDE'], errors='coerce')
+    return frame.dropna(subset=['LATITUDE', 'LONGITUDE'])
+
+
+def swap_in(staging: str, output_dir: str):
+    """Replace output_dir with staging (two renames on the same filesystem)"""
+    old = None
+    if os.path.exists(output_dir):
+        old = f"{staging}.old"
+        os.replace(output_dir, old)
+    os.replace(staging, output_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_pyramid(output_dir: str, levels: Dict[int, tuple], frame: pd.DataFrame, offenses: List[str],
+                  min_zoom: int, max_zoom: int, cell_bits: int) -> Tuple[dict, int]:
+    """Write every tile and tileset.json into output_dir; returns the tileset and the tile bytes"""
+    version = hashlib.sha256()
+    tile_counts = {}
+    total_bytes = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        tile_counts[zoom] = 0
+        for x, y, payload in tile_payloads(levels[zoom], cell_bits):
+            data = json.dumps(payload, separators=COMPACT).encode('utf-8')
+            path = os.path.join(output_dir, str(zoom), str(x), f"{y}.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            version.update(f"{zoom}/{x}/{y}".encode('utf-8'))
+            version.update(data)
+            tile_counts[zoom] += 1
+            total_bytes += len(data)
+
+    tileset = {
+        'version': version.hexdigest()[:12],
+        'min_zoom': min_zoom,
+        'max_zoom': max_zoom,
+        'cells_per_tile': 1 << cell_bits,
+        'offenses': offenses,
+        'total_points': int(len(frame)),
+        'bounds': [float(frame['LONGITUDE'].min()), float(frame['LATITUDE'].min()),
+                   float(frame['LONGITUDE'].max()), float(frame['LATITUDE'].max())],
+        'tiles': tile_counts,
+    }
+    with open(os.path.join(output_dir, TILESET_NAME), 'w', encoding='utf-8') as f:
+        json.dump(tileset, f, separators=COMPACT)
+    return tileset, total_bytes
+
+
+def build_tiles(csv_path: str = 'DC_Crime_Incidents_in_2025_with_zipcode.csv', output_dir: str = 'tiles',
+                min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM, cell_bits: int = CELL_BITS) -> Optional[str]:
+    """Write the tile pyramid; returns the tileset.json path (None if the arguments are
+    invalid, the CSV is missing or has no points, or output_dir holds something
+    other than a tile pyramid)"""
+    if not 0 <= min_zoom <= max_zoom or cell_bits < 0:
+        print(f"Error: need 0 <= min_zoom <= max_zoom and cell_bits >= 0 (got {min_zoom}, {max_zoom}, {cell_bits}).")
+        return None
+    if not os.path.exists(csv_path):
+        print(f"Error: {csv_path} not found.")
+        return None
+    # Refuse to replace a directory this script did not write
+    if os.path.isdir(output_dir) and os.listdir(output_dir) \
+            and not os.path.exists(os.path.join(output_dir, TILESET_NAME)):
+        print(f"Error: {output_dir} is not empty and has no {TILESET_NAME}; not replacing it.")
+        return None
+
+    frame = load_points(csv_path)
+    if frame.empty:
+        print(f"Error: {csv_path} has no rows with coordinates.")
+        return None
+    offense_codes, offenses = pd.factorize(frame['OFFENSE'].fillna('UNKNOWN'), sort=True)
+    offense_bits = max(len(offenses) - 1, 1).bit_length()
+    if 2 * (max_zoom + cell_bits) + offense_bits > MAX_KEY_BITS:
+        print(f"Error: max_zoom + cell_bits = {max_zoom + cell_bits} is too fine for {len(offenses)} offenses "
+              f"(cell keys would overflow int64; keep it at most {(MAX_KEY_BITS - offense_bits) // 2}).")
+        return None
+    fx, fy = mercator_fractions(frame['LATITUDE'].to_numpy(), frame['LONGITUDE'].to_numpy())
+    levels = build_pyramid(fx, fy, offense_codes, min_zoom, max_zoom, cell_bits)
+
+    # Write the new pyramid next to the old one and swap it in, so stale tiles
+    # never survive and readers never see a half-written tree
+    parent = os.path.dirname(os.path.abspath(output_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.abspath(output_dir))}-", dir=parent)
+    os.chmod(staging, 0o755)
+    try:
+        tileset, total_bytes = write_pyramid(staging, levels, frame, list(offenses), min_zoom, max_zoom, cell_bits)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    swap_in(staging, output_dir)
+
+    print(f"Binned {len(frame):,} points into {sum(tileset['tiles'].values())} tiles "
+          f"(z{min_zoom}-{max_zoom}, {1 << cell_bits}x{1 << cell_bits} cells, {total_bytes:,} bytes)")
+    return os.path.join(output_dir, TILESET_NAME)
+
+
+def tile_files(output_dir: str) -> List[str]:
+    """Tile paths relative to output_dir (z/x/y.json), tileset.json excluded"""
+    files = []
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            rel = os.path.relpath(os.path.join(root, name), output_dir)
+            if name.endswith('.json') and rel != TILESET_NAME:
+                files.append(rel.replace(os.sep, '/'))
+    return sorted(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the crime heat-map tile pyramid")
+    parser.add_argument("--csv", default="DC_Crime_Incidents_in_2025_with_zipcode.csv", help="Crime CSV")
+    parser.add_argument("--output-dir", default="tiles", help="Output directory")
+    parser.add_argument("--min-zoom", type=int, default=MIN_ZOOM)
+    parser.add_argument("--max-zoom", type=int, default=MAX_ZOOM)
+    parser.add_argument("--cell-bits", type=int, default=CELL_BITS, help="log2 of cells per tile side")
+    args = parser.parse_args()
+    if build_tiles(args.csv, args.output_dir, args.min_zoom, args.max_zoom, args.cell_bits) is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,10 +5,12 @@ from supabase import create_client
 load_dotenv("backend/.env")
 supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
 
-response = supabase.table("documents").select("id, metadata").order("id").execute()
+response = supabase.table("documents").select("id, metadata, source_version, deleted_at").order("id").execute()
 
-print(f"Total documents: {len(response.data)}")
+live = [doc for doc in response.data if not doc.get('deleted_at')]
+print(f"Total documents: {len(response.data)} ({len(live)} live, {len(response.data) - len(live)} tombstoned)")
 for doc in response.data:
     source = doc['metadata'].get('source', 'Unknown')
     section = doc['metadata'].get('section', 'Unknown')
-    print(f"ID: {doc['id']} | Source: {source} | Section: {section}")
+    status = f"deleted {doc['deleted_at']}" if doc.get('deleted_at') else "live"
+    print(f"ID: {doc['id']} | Source: {source} v{doc.get('source_version')} | Section: {section} | {status}")
@@ -0,0 +1,256 @@
+"""
+Shared batch upload engine for the PostgREST upload scripts.
+
+upload_batches() keeps several batches in flight on a thread pool and sizes
+each new batch from what it has observed so far: batches grow while requests
+come back well under `target_latency` and shrink when they are slow or when
+the JSON payload approaches `max_payload_bytes`. A failed batch is retried
+if the error looks transient, and otherwise split in half until the bad rows
+are isolated, so a single broken record costs O(log n) extra requests
+instead of one request per record. Records that still fail on their own go
+to a JSON-lines dead-letter file together with the error. A transient error
+that outlasts its retries means the target is down, not that a row is bad:
+the upload is aborted instead of bisected, and every row not yet written is
+reported in result.unsent so the caller can retry it on the next run.
+
+Batches are row ranges over a source that serializes them on demand
+(records.JsonColumns, or RecordList for a plain list of dicts), and `send`
+receives the JSON payload bytes.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import httpx
+    TRANSIENT_ERRORS = (httpx.TransportError, ConnectionError, TimeoutError)
+except ImportError:
+    TRANSIENT_ERRORS = (ConnectionError, TimeoutError)
+
+DEAD_LETTER_DIR = "dead_letter"
+TRANSIENT_STATUS = {"408", "429", "500", "502", "503", "504"}
+
+
+class UploadError(Exception):
+    """A PostgREST request that came back with an error status"""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"HTTP {status}: {body[:500]}")
+        self.code = str(status)
+
+
+def is_transient(error: Exception) -> bool:
+    """Network trouble or an overloaded server, as opposed to a row the database rejects"""
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return str(getattr(error, "code", "")) in TRANSIENT_STATUS
+
+
+class RecordList:
+    """Batch source over an in-memory list of dicts"""
+
+    def __init__(self, records: Sequence[Dict[str, Any]]):
+        self._records = records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def payload(self, start: int, stop: int) -> bytes:
+        return json.dumps(list(self._records[start:stop]), default=str).encode("utf-8")
+
+    def records(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        return list(self._records[start:stop])
+
+
+def postgrest_upsert(supabase, table: str, on_conflict: str) -> Callable[[bytes], None]:
+    """
+    `send` for upload_batches(): posts the already-serialized JSON straight to
+    PostgREST on the client's pooled session, merging on `on_conflict` and
+    asking for no response body.
+    """
+    session = supabase.postgrest.session
+    headers = {
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal",
+    }
+
+    def send(payload: bytes):
+        response = session.post(table, content=payload, params={"on_conflict": on_conflict}, headers=headers)
+        if response.status_code >= 400:
+            raise UploadError(response.status_code, response.text)
+
+    return send
+
+
+class AdaptiveBatchSize:
+    """Multiplicative increase / decrease of the batch size from observed latency and payload"""
+
+    def __init__(self, initial: int = 500, minimum: int = 50, maximum: int = 5000,
+                 target_latency: float = 1.0, max_payload_bytes: int = 2_000_000):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_payload_bytes = max_payload_bytes
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        with self._lock:
+            return self.size
+
+    def observe(self, rows: int, seconds: float, payload_bytes: int):
+        with self._lock:
+            if seconds > self.target_latency:
+                size = self.size // 2
+            elif seconds < self.target_latency / 2:
+                size = int(self.size * 1.5)
+            else:
+                size = self.size
+            # Stay well under the request body limit
+            if rows and payload_bytes:
+                size = min(size, int(self.max_payload_bytes * 0.8 / (payload_bytes / rows)))
+            self.size = max(self.minimum, min(self.maximum, size))
+
+    def shrink(self):
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+@dataclass
+class UploadResult:
+    label: str
+    total: int
+    uploaded: int = 0
+    requests: int = 0
+    seconds: float = 0.0
+    failed: List[Dict[str, Any]] = field(default_factory=list)
+    dead_letter_path: Optional[str] = None
+    aborted: Optional[str] = None  # error that stopped the upload
+    unsent: List[Tuple[int, int]] = field(default_factory=list)  # row ranges never written
+
+    @property
+    def unsent_rows(self) -> int:
+        return sum(stop - start for start, stop in self.unsent)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.uploaded / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        text = (f"{self.label}: {self.uploaded}/{self.total} rows in {self.requests} requests, "
+                f"{self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/sec)")
+        if self.failed:
+            text += f", {len(self.failed)} failed -> {self.dead_letter_path}"
+        if self.aborted:
+            text += f", aborted with {self.unsent_rows} rows unsent ({self.aborted})"
+        return text
+
+
+@dataclass
+class _Batch:
+    start: int
+    stop: int
+    attempt: int = 0
+
+
+def write_dead_letter(label: str, failed: List[Dict[str, Any]], directory: str = DEAD_LETTER_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{label}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in failed:
+            f.write(json.dumps(entry, default=str, ensure_ascii=False) + "\n")
+    return path
+
+
+def upload_batches(source, send: Callable[[bytes], Any],
+                   label: str = "upload", workers: int = 4, retries: int = 2,
+                   batch_size: Optional[AdaptiveBatchSize] = None,
+                   dead_letter_dir: str = DEAD_LETTER_DIR, progress: bool = True) -> UploadResult:
+    """
+    Send `source` (JsonColumns, RecordList or a list of dicts) through
+    `send(payload_bytes)` with up to `workers` batches in flight.
+    Returns an UploadResult; result.failed holds {"record", "error"} entries
+    and, after an abort, result.unsent the (start, stop) ranges not written.
+    """
+    if isinstance(source, (list, tuple)):
+        source = RecordList(source)
+    sizer = batch_size or AdaptiveBatchSize()
+    result = UploadResult(label, len(source))
+    start = time.perf_counter()
+    next_index = 0
+
+    def run(batch: _Batch):
+        if batch.attempt:
+            time.sleep(min(2 ** (batch.attempt - 1), 10))
+        payload = source.payload(batch.start, batch.stop)
+        began = time.perf_counter()
+        send(payload)
+        return time.perf_counter() - began, len(payload)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=label) as pool:
+        pending = {}
+        retry_queue: List[_Batch] = []
+
+        def fill():
+            nonlocal next_index
+            while len(pending) < workers and not result.aborted:
+                if retry_queue:
+                    batch = retry_queue.pop()
+                elif next_index < len(source):
+                    stop = min(next_index + sizer.current(), len(source))
+                    batch = _Batch(next_index, stop)
+                    next_index = stop
+                else:
+                    return
+                pending[pool.submit(run, batch)] = batch
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                rows = batch.stop - batch.start
+                result.requests += 1
+                error = future.exception()
+                if error is None:
+                    result.uploaded += rows
+                    if batch.attempt == 0:
+                        seconds, payload_bytes = future.result()
+                        sizer.observe(rows, seconds, payload_bytes)
+                    if progress:
+                        print(f"   {label}: {result.uploaded}/{result.total} "
+                              f"({result.uploaded / max(result.total, 1) * 100:.1f}%, batch {sizer.current()})")
+                    continue
+
+                if is_transient(error):
+                    if batch.attempt < retries and not result.aborted:
+                        sizer.shrink()
+                        retry_queue.append(_Batch(batch.start, batch.stop, batch.attempt + 1))
+                    else:
+                        # Still failing after the backoff: stop instead of bisecting an outage
+                        result.aborted = result.aborted or str(error)
+                        result.unsent.append((batch.start, batch.stop))
+                elif rows > 1:
+                    # Bisect to isolate the rows the database rejects
+                    middle = batch.start + rows // 2
+                    retry_queue.append(_Batch(middle, batch.stop))
+                    retry_queue.append(_Batch(batch.start, middle))
+                else:
+                    result.failed.append({"record": source.records(batch.start, batch.stop)[0], "error": str(error)})
+            fill()
+
+        if result.aborted:
+            result.unsent.extend((b.start, b.stop) for b in retry_queue)
+            if next_index < len(source):
+                result.unsent.append((next_index, len(source)))
+            result.unsent.sort()
+
+    result.seconds = time.perf_counter() - start
+    if result.failed:
+        result.dead_letter_path = write_dead_letter(label, result.failed, dead_letter_dir)
+    return result
@@ -0,0 +1,109 @@
+"""
+Delta uploads: only push rows that changed since the last successful upload.
+
+A local SQLite manifest keeps (key, row hash) for every row last written to a
+given target table. compute_delta() hashes the prepared frame column-wise,
+compares it with the manifest and returns the new/changed rows plus the keys
+that disappeared. After the upload, commit_delta() records exactly what was
+written (minus any failed keys) in one SQLite transaction, so an interrupted
+or partially failed run is simply retried next time.
+"""
+import hashlib
+import os
+import sqlite3
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MANIFEST_PATH = os.path.join(".cache", "upload_manifest.sqlite3")
+
+# Refuse to delete more than this share of the known rows in one run
+# (a truncated export would otherwise wipe the table)
+MAX_DELETE_FRACTION = 0.5
+
+
+@dataclass
+class DeltaPlan:
+    scope: str
+    key: str
+    changed: pd.DataFrame
+    removed: List[str]
+    hashes: pd.Series  # key -> int64 row hash, for the changed rows
+    known_rows: int
+    unchanged_rows: int
+    deletes_blocked: bool = False
+
+    def summary(self) -> str:
+        text = (f"{len(self.changed)} new/changed, {self.unchanged_rows} unchanged, "
+                f"{len(self.removed)} removed (manifest had {self.known_rows})")
+        if self.deletes_blocked:
+            text += " - deletes skipped, too many rows missing"
+        return text
+
+
+def manifest_scope(target: Optional[str], table: str) -> str:
+    """Manifest rows are per target database and table (the target is hashed: it may hold a password)"""
+    digest = hashlib.sha256((target or "default").encode("utf-8")).hexdigest()[:16]
+    return f"{digest}/{table}"
+
+
+def row_hashes(frame: pd.DataFrame, key: str) -> pd.Series:
+    """int64 hash of every row, indexed by key (computed column-wise by pandas)"""
+    hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy().view(np.int64)
+    return pd.Series(hashes, index=frame[key].astype(str).to_numpy())
+
+
+def open_manifest(path: str = DEFAULT_MANIFEST_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        create table if not exists manifest (
+          scope text not null,
+          key text not null,
+          hash integer not null,
+          primary key (scope, key)
+        )
+    """)
+    return conn
+
+
+def compute_delta(conn: sqlite3.Connection, scope: str, frame: pd.DataFrame, key: str,
+                  full: bool = False) -> DeltaPlan:
+    current = row_hashes(frame, key)
+    previous = pd.Series(dict(conn.execute("select key, hash from manifest where scope = ?", (scope,)).fetchall()),
+                         dtype=np.int64)
+
+    if full or previous.empty:
+        changed_mask = np.ones(len(current), dtype=bool)
+    else:
+        changed_mask = (previous.reindex(current.index) != current).to_numpy()
+    removed = [] if full else list(previous.index.difference(current.index))
+
+    blocked = bool(len(previous)) and len(removed) > MAX_DELETE_FRACTION * len(previous)
+    return DeltaPlan(
+        scope=scope,
+        key=key,
+        changed=frame[changed_mask],
+        removed=[] if blocked else removed,
+        hashes=current[changed_mask],
+        known_rows=len(previous),
+        unchanged_rows=int((~changed_mask).sum()),
+        deletes_blocked=blocked,
+    )
+
+
+def commit_delta(conn: sqlite3.Connection, plan: DeltaPlan, failed_keys: Iterable[str] = ()):
+    """Record a finished upload; rows whose upsert failed stay out of the manifest"""
+    failed = {str(k) for k in failed_keys}
+    written = plan.hashes[~plan.hashes.index.isin(list(failed))] if failed else plan.hashes
+    with conn:
+        conn.executemany(
+            "insert or replace into manifest (scope, key, hash) values (?, ?, ?)",
+            ((plan.scope, k, int(h)) for k, h in written.items()),
+        )
+        conn.executemany(
+            "delete from manifest where scope = ? and key = ?",
+            ((plan.scope, k) for k in plan.removed),
+        )
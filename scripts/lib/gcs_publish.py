@@ -0,0 +1,381 @@
+"""
+Publish build artifacts to a GCS bucket.
+
+Each artifact is gzip-compressed (deterministically, so identical content
+always produces identical bytes) when its type compresses well, and its
+MD5 / CRC32C are compared with the remote object's metadata before
+anything is sent: unchanged objects are skipped without transferring a
+byte. Files above RESUMABLE_THRESHOLD go through chunked resumable
+uploads, and several artifacts upload at once on a thread pool. Every
+write carries an if_generation_match precondition, which makes it safe
+for the client library to retry.
+
+publish_versioned() builds on this for cache-friendly releases: every file
+goes to an immutable, content-addressed name (frontend_data.<sha>.json,
+cached for a year), and only after all of them are in place is the small
+manifest.json rewritten to point at the new names. A single-object write
+is atomic in GCS, so readers see either the old or the new release, never
+a mix, and only the manifest has to be revalidated.
+
+publish() only needs a bucket-like object with get_blob(name) and
+blob(name, chunk_size=...), so it runs unchanged against a real bucket,
+the fake-gcs-server emulator (STORAGE_EMULATOR_HOST) or LocalBucket.
+"""
+import base64
+import gzip
+import hashlib
+import io
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+RESUMABLE_THRESHOLD = 8 * 1024 * 1024
+CHUNK_SIZE = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+COMPRESSIBLE_TYPES = ('application/json', 'application/geo+json', 'text/')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_CACHE_CONTROL = 'no-cache'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+
+
+@dataclass
+class Artifact:
+    path: str
+    name: str  # object name in the bucket
+    content_type: Optional[str] = None
+    compress: Optional[bool] = None  # None: compress text-like types
+    cache_control: Optional[str] = None
+    metadata: Dict[str, str] = field(default_factory=dict)
+
+    def resolved_content_type(self) -> str:
+        if self.content_type:
+            return self.content_type
+        guessed, _ = mimetypes.guess_type(self.path)
+        return guessed or 'application/octet-stream'
+
+
+@dataclass
+class PreparedArtifact:
+    artifact: Artifact
+    data: bytes
+    raw_size: int
+    md5: str  # base64, as GCS reports it
+    crc32c: Optional[str]
+    content_encoding: Optional[str]
+
+
+@dataclass
+class PublishedObject:
+    name: str
+    status: str  # uploaded | skipped | failed
+    raw_size: int
+    stored_size: int
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+@dataclass
+class PublishResult:
+    objects: List[PublishedObject] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def count(self, status: str) -> int:
+        return sum(1 for o in self.objects if o.status == status)
+
+    @property
+    def raw_bytes(self) -> int:
+        return sum(o.raw_size for o in self.objects)
+
+    @property
+    def sent_bytes(self) -> int:
+        return sum(o.stored_size for o in self.objects if o.status == 'uploaded')
+
+    @property
+    def bytes_saved(self) -> int:
+        """Bytes not sent thanks to compression and skipped unchanged objects"""
+        return sum(o.raw_size - (o.stored_size if o.status == 'uploaded' else 0)
+                   for o in self.objects if o.status != 'failed')
+
+    @property
+    def ok(self) -> bool:
+        return not self.count('failed')
+
+    def __str__(self) -> str:
+        saved = self.bytes_saved / self.raw_bytes * 100 if self.raw_bytes else 0.0
+        return (f"{self.count('uploaded')} uploaded, {self.count('skipped')} unchanged, "
+                f"{self.count('failed')} failed in {self.seconds:.2f}s; "
+                f"sent {self.sent_bytes:,} of {self.raw_bytes:,} bytes (saved {self.bytes_saved:,}, {saved:.1f}%)")
+
+
+def _b64(digest: bytes) -> str:
+    return base64.b64encode(digest).decode('ascii')
+
+
+def checksums(data: bytes):
+    """(md5, crc32c) in the base64 form GCS uses; crc32c is None without google-crc32c"""
+    md5 = _b64(hashlib.md5(data).digest())
+    crc = _b64(google_crc32c.Checksum(data).digest()) if google_crc32c else None
+    return md5, crc
+
+
+def prepare(artifact: Artifact) -> PreparedArtifact:
+    with open(artifact.path, 'rb') as f:
+        raw = f.read()
+    compress = artifact.compress
+    if compress is None:
+        compress = artifact.resolved_content_type().startswith(COMPRESSIBLE_TYPES)
+    # mtime=0 keeps the gzip bytes (and so the checksums) stable across runs
+    data = gzip.compress(raw, compresslevel=9, mtime=0) if compress else raw
+    md5, crc = checksums(data)
+    return PreparedArtifact(artifact, data, len(raw), md5, crc, 'gzip' if compress else None)
+
+
+def is_unchanged(remote, prepared: PreparedArtifact) -> bool:
+    if remote is None or (remote.content_encoding or None) != prepared.content_encoding:
+        return False
+    compared = False
+    if prepared.crc32c and remote.crc32c:
+        if remote.crc32c != prepared.crc32c:
+            return False
+        compared = True
+    if remote.md5_hash:  # composite objects have no MD5
+        if remote.md5_hash != prepared.md5:
+            return False
+        compared = True
+    return compared
+
+
+def publish_one(bucket, artifact: Artifact, force: bool = False) -> PublishedObject:
+    start = time.perf_counter()
+    prepared = prepare(artifact)
+    remote = bucket.get_blob(artifact.name)
+    if not force and is_unchanged(remote, prepared):
+        return PublishedObject(artifact.name, 'skipped', prepared.raw_size, len(prepared.data),
+                               time.perf_counter() - start)
+
+    size = len(prepared.data)
+    blob = bucket.blob(artifact.name, chunk_size=CHUNK_SIZE if size > RESUMABLE_THRESHOLD else None)
+    blob.content_encoding = prepared.content_encoding
+    blob.cache_control = artifact.cache_control
+    blob.metadata = artifact.metadata or None
+    blob.upload_from_file(
+        io.BytesIO(prepared.data),
+        size=size,
+        content_type=artifact.resolved_content_type(),
+        # Create-only or replace-exactly-this-generation: lets the library retry safely
+        if_generation_match=remote.generation if remote is not None else 0,
+    )
+    return PublishedObject(artifact.name, 'uploaded', prepared.raw_size, size, time.perf_counter() - start)
+
+
+def publish(bucket, artifacts: Sequence[Artifact], workers: int = 4, force: bool = False,
+            progress: bool = True) -> PublishResult:
+    """Upload `artifacts` concurrently, skipping objects whose content is already in the bucket"""
+    result = PublishResult()
+    start = time.perf_counter()
+
+    def run(artifact: Artifact) -> PublishedObject:
+        try:
+            published = publish_one(bucket, artifact, force)
+        except Exception as e:
+            published = PublishedObject(artifact.name, 'failed', os.path.getsize(artifact.path)
+                                        if os.path.exists(artifact.path) else 0, 0, error=str(e))
+        if progress:
+            detail = f" - {published.error}" if published.error else ""
+            print(f"   {published.status:<8} {published.name} "
+                  f"({published.raw_size:,} -> {published.stored_size:,} bytes){detail}")
+        return published
+
+    if artifacts:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(artifacts))), thread_name_prefix='gcs') as pool:
+            result.objects = list(pool.map(run, artifacts))
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def versioned_name(prefix: str, path: str, sha256: str) -> str:
+    """data/ + frontend_data.json -> data/frontend_data.<hash>.json"""
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f"{prefix}{stem}.{sha256[:HASH_LENGTH]}{ext}"
+
+
+def read_manifest(bucket, name: str):
+    """(manifest dict or None, generation or 0)"""
+    blob = bucket.get_blob(name)
+    if blob is None:
+        return None, 0
+    return json.loads(blob.download_as_bytes()), blob.generation
+
+
+def write_manifest(bucket, name: str, manifest: dict, if_generation_match: int):
+    """
+    Replace the manifest in one write. The generation precondition makes it a
+    compare-and-swap: a concurrent publisher that got there first fails this
+    write instead of being silently overwritten.
+    """
+    data = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+    blob = bucket.blob(name)
+    blob.cache_control = MANIFEST_CACHE_CONTROL
+    blob.upload_from_file(io.BytesIO(data), size=len(data), content_type='application/json',
+                          if_generation_match=if_generation_match)
+
+
+def publish_versioned(bucket, paths: Sequence[str], prefix: str = '', workers: int = 4,
+                      force: bool = False, progress: bool = True, extra: Optional[dict] = None):
+    """
+    Upload `paths` under content-hashed names, then swap `<prefix>manifest.json`
+    (`extra` is merged into it). Returns (PublishResult, manifest); the
+    manifest is None when anything failed, in which case the published
+    release is left untouched.
+    """
+    manifest_name = prefix + MANIFEST_NAME
+    previous, generation = read_manifest(bucket, manifest_name)
+
+    files = {}
+    artifacts = []
+    for path in paths:
+        sha256 = file_sha256(path)
+        name = versioned_name(prefix, path, sha256)
+        files[os.path.basename(path)] = {'path': name, 'sha256': sha256, 'bytes': os.path.getsize(path)}
+        artifacts.append(Artifact(path, name, cache_control=IMMUTABLE_CACHE_CONTROL))
+
+    result = publish(bucket, artifacts, workers=workers, force=force, progress=progress)
+    if not result.ok:
+        return result, None
+
+    version = hashlib.sha256(json.dumps(
+        [sorted((key, entry['sha256']) for key, entry in files.items()), extra or {}],
+        sort_keys=True).encode('utf-8')).hexdigest()[:HASH_LENGTH]
+    if previous and previous.get('version') == version and not force:
+        return result, previous
+
+    manifest = {
+        **(extra or {}),
+        'version': version,
+        'previous_version': previous.get('version') if previous else None,
+        'published_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'files': files,
+    }
+    write_manifest(bucket, manifest_name, manifest, generation)
+    return result, manifest
+
+
+class LocalBlob:
+    """Directory-backed stand-in for google.cloud.storage.Blob (the subset publish() uses)"""
+
+    def __init__(self, bucket: 'LocalBucket', name: str, chunk_size: Optional[int] = None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.content_type = None
+        self.content_encoding = None
+        self.cache_control = None
+        self.metadata = None
+        self.md5_hash = None
+        self.crc32c = None
+        self.generation = None
+        self.size = None
+
+    @property
+    def public_url(self) -> str:
+        return 'file://' + os.path.abspath(self.bucket.object_path(self.name))
+
+    def upload_from_file(self, file_obj, size=None, content_type=None, if_generation_match=None, **kwargs):
+        data = file_obj.read() if size is None else file_obj.read(size)
+        current = self.bucket.get_blob(self.name)
+        if if_generation_match is not None and (current.generation if current else 0) != if_generation_match:
+            raise RuntimeError(f"Precondition failed for {self.name}: generation changed")
+        self.content_type = content_type or self.content_type
+        self.md5_hash, self.crc32c = checksums(data)
+        self.generation = (current.generation if current else 0) + 1
+        self.size = len(data)
+        self.bucket.write(self, data)
+
+    def download_as_bytes(self) -> bytes:
+        with open(self.bucket.object_path(self.name), 'rb') as f:
+            return f.read()
+
+
+class LocalBucket:
+    """
+    A bucket in a local directory: objects as files, their metadata in a
+    .meta/ sidecar. Used for dry runs (GCS_LOCAL_DIR) and to exercise the
+    publisher without GCS.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.name = os.path.basename(os.path.abspath(root))
+
+    def object_path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _meta_path(self, name: str) -> str:
+        return os.path.join(self.root, '.meta', name + '.json')
+
+    def blob(self, name: str, chunk_size: Optional[int] = None) -> LocalBlob:
+        return LocalBlob(self, name, chunk_size)
+
+    def get_blob(self, name: str) -> Optional[LocalBlob]:
+        try:
+            with open(self._meta_path(name), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        blob = LocalBlob(self, name)
+        for key, value in meta.items():
+            setattr(blob, key, value)
+        return blob
+
+    def write(self, blob: LocalBlob, data: bytes):
+        for path in (self.object_path(blob.name), self._meta_path(blob.name)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = self.object_path(blob.name) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self.object_path(blob.name))
+        meta = {key: getattr(blob, key) for key in (
+            'content_type', 'content_encoding', 'cache_control', 'metadata',
+            'md5_hash', 'crc32c', 'generation', 'size')}
+        with open(self._meta_path(blob.name), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+
+def open_bucket(bucket_name: str, credentials_path: Optional[str] = None):
+    """
+    LocalBucket when GCS_LOCAL_DIR is set, otherwise a google-cloud-storage
+    bucket (which talks to the emulator on its own when STORAGE_EMULATOR_HOST is set).
+    """
+    local_dir = os.getenv('GCS_LOCAL_DIR')
+    if local_dir:
+        return LocalBucket(os.path.join(local_dir, bucket_name))
+
+    from google.cloud import storage
+    if credentials_path:
+        from google.oauth2 import service_account
+        credentials = service_account.Credentials.from_service_account_file(credentials_path)
+        client = storage.Client(credentials=credentials)
+    elif os.getenv('STORAGE_EMULATOR_HOST'):
+        client = storage.Client(project=os.getenv('GCP_PROJECT', 'local'))
+    else:
+        client = storage.Client()
+    return client.bucket(bucket_name)
@@ -0,0 +1,138 @@
+"""
+Direct Postgres loader for the upload scripts.
+
+Instead of 1000-row JSON upserts through PostgREST, a prepared DataFrame is
+streamed with `COPY ... FROM STDIN (FORMAT csv)` into a temporary staging
+table shaped like the target, then merged with one set-based
+`INSERT ... SELECT ... ON CONFLICT DO UPDATE`. The whole load is a single
+transaction. Works against Supabase (DATABASE_URL = the project's Postgres
+connection string) or any local Postgres with the same tables.
+"""
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import psycopg
+    from psycopg import sql
+except ImportError:
+    psycopg = None
+    sql = None
+
+COPY_CHUNK_ROWS = 50000
+
+
+@dataclass
+class LoadStats:
+    table: str
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.table}: {self.rows} rows in {self.seconds:.2f}s ({self.rows_per_sec:,.0f} rows/sec)"
+
+
+def get_database_url() -> Optional[str]:
+    return os.getenv('DATABASE_URL') or os.getenv('SUPABASE_DB_URL')
+
+
+def connect(database_url: Optional[str] = None):
+    if psycopg is None:
+        raise RuntimeError("COPY loader requires psycopg: pip install 'psycopg[binary]'")
+    database_url = database_url or get_database_url()
+    if not database_url:
+        raise RuntimeError("COPY loader requires DATABASE_URL (Postgres connection string)")
+    return psycopg.connect(database_url)
+
+
+def iter_csv_chunks(frame: pd.DataFrame, chunk_rows: int = COPY_CHUNK_ROWS) -> Iterator[str]:
+    """CSV text for COPY, a slice at a time; missing values become unquoted empty fields (NULL)"""
+    for start in range(0, len(frame), chunk_rows):
+        yield frame.iloc[start:start + chunk_rows].to_csv(index=False, header=False, na_rep='')
+
+
+def copy_merge(frame: pd.DataFrame, table: str, key_columns: Sequence[str],
+               conn=None, chunk_rows: int = COPY_CHUNK_ROWS, delete_keys: Sequence = ()) -> LoadStats:
+    """
+    COPY `frame` into a staging copy of `table`, then upsert it on `key_columns`.
+    Rows repeating a key within the frame are collapsed to one before the merge.
+    `delete_keys` (single-column keys only) are deleted in the same transaction.
+    """
+    columns: List[str] = list(frame.columns)
+    update_columns = [c for c in columns if c not in key_columns]
+    stage = f"_stage_{table}"
+
+    own_conn = conn is None
+    conn = conn or connect()
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cols = sql.SQL(', ').join(map(sql.Identifier, columns))
+            keys = sql.SQL(', ').join(map(sql.Identifier, key_columns))
+
+            # Same column types as the target, so COPY does the parsing
+            cur.execute(sql.SQL(
+                "create temp table {stage} on commit drop as select {cols} from {table} with no data"
+            ).format(stage=sql.Identifier(stage), cols=cols, table=sql.Identifier(table)))
+
+            copy_stmt = sql.SQL("copy {stage} ({cols}) from stdin (format csv)").format(
+                stage=sql.Identifier(stage), cols=cols)
+            with cur.copy(copy_stmt) as copy:
+                for chunk in iter_csv_chunks(frame, chunk_rows):
+                    copy.write(chunk)
+
+            if update_columns:
+                action = sql.SQL("do update set {}").format(sql.SQL(', ').join(
+                    sql.SQL("{col} = excluded.{col}").format(col=sql.Identifier(c)) for c in update_columns
+                ))
+            else:
+                action = sql.SQL("do nothing")
+            cur.execute(sql.SQL(
+                "insert into {table} ({cols}) "
+                "select distinct on ({keys}) {cols} from {stage} "
+                "on conflict ({keys}) {action}"
+            ).format(table=sql.Identifier(table), cols=cols, keys=keys,
+                     stage=sql.Identifier(stage), action=action))
+            rows = cur.rowcount
+
+            if delete_keys:
+                if len(key_columns) != 1:
+                    raise ValueError("delete_keys needs a single key column")
+                cur.execute(sql.SQL("delete from {table} where {key}::text = any(%s)").format(
+                    table=sql.Identifier(table), key=sql.Identifier(key_columns[0])), (list(delete_keys),))
+                print(f"   Deleted {cur.rowcount} rows from {table}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if own_conn:
+            conn.close()
+
+    return LoadStats(table, rows, time.perf_counter() - start)
+
+
+def call_functions(functions: Sequence[str], conn=None):
+    """SQL counterpart of refresh_aggregates() for the COPY path"""
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        for function_name in functions:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("select {}()").format(sql.Identifier(function_name)))
+                conn.commit()
+                print(f"   ✅ 已執行 {function_name}()")
+            except Exception as e:
+                conn.rollback()
+                print(f"   ⚠️  無法執行 {function_name}(): {e}")
+    finally:
+        if own_conn:
+            conn.close()
@@ -0,0 +1,69 @@
+"""
+Column-wise JSON serialization of prepared upload frames.
+
+JsonColumns encodes the columns of a DataFrame, vectorized per dtype, into
+JSON value fragments ("null" for NaN/NaT/NA/None, ISO-8601 strings for
+datetimes, escaped strings for text). Encoding happens lazily per upload
+batch: payload(start, stop) only converts that row range and joins it into
+JSON bytes, so the uploader never holds a string per cell or a list of
+per-row dicts, and missing values reach the database as real NULLs rather
+than empty strings.
+"""
+import json
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+
+
+def _encode_object(value: Any) -> str:
+    if value is None or value is pd.NA or value is pd.NaT or (isinstance(value, float) and np.isnan(value)):
+        return 'null'
+    if isinstance(value, np.generic):
+        value = value.item()
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def encode_column(series: pd.Series) -> np.ndarray:
+    """JSON fragment for every value of one column, as an object array"""
+    missing = series.isna().to_numpy()
+    if pd.api.types.is_bool_dtype(series):
+        values = series.fillna(False).to_numpy(dtype=bool)
+        return np.where(missing, 'null', np.where(values, 'true', 'false')).astype(object)
+    if pd.api.types.is_integer_dtype(series):
+        # Nullable Int64 would otherwise render pd.NA as "<NA>"
+        return np.where(missing, 'null', series.astype(str).to_numpy(dtype=object)).astype(object)
+    if pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.where(np.isfinite(values), series.astype(str).to_numpy(dtype=object), 'null').astype(object)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        text = series.dt.strftime(DATETIME_FORMAT)
+        return np.where(missing, 'null', '"' + text.fillna('') + '"').astype(object)
+    return series.map(_encode_object).to_numpy(dtype=object)
+
+
+class JsonColumns:
+    """A prepared frame that yields JSON array payloads for row ranges on demand"""
+
+    def __init__(self, frame: pd.DataFrame):
+        self.columns = list(frame.columns)
+        self._frame = frame
+        self._keys = [json.dumps(column) + ':' for column in self.columns]
+        self._length = len(frame)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def payload(self, start: int, stop: int) -> bytes:
+        if stop <= start:
+            return b'[]'
+        chunk = self._frame.iloc[start:stop]
+        fragments = [key + encode_column(chunk[column]) for key, column in zip(self._keys, self.columns)]
+        rows = map(','.join, zip(*fragments))
+        return ('[{' + '},{'.join(rows) + '}]').encode('utf-8')
+
+    def records(self, start: int, stop: int) -> List[Dict[str, Any]]:
+        """Decoded rows, only needed for error reporting (dead letters)"""
+        return json.loads(self.payload(start, stop))
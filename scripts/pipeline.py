@@ -2,12 +2,27 @@
 """
 Data Automation Pipeline
 Orchestrates the flow: Ingest -> Process -> Upload -> Export
+
+Stages run in-process as a small DAG: each stage declares the artifacts it
+reads (inputs) and writes (outputs), and a stage becomes ready as soon as every
+stage producing one of its inputs has finished. Ready stages run concurrently on
+a bounded thread pool, so independent uploads (Supabase, GCS, knowledge base)
+overlap instead of running back to back. A failed stage only skips the stages
+downstream of it.
 """
 import os
 import sys
+import time
 import argparse
 import logging
-from datetime import datetime
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Add parent directory to path to allow imports from scripts.*
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 # Setup logging
 logging.basicConfig(
@@ -20,40 +35,246 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_step(step_name, command):
-    """Run a shell command and check for errors"""
-    logger.info(f"Starting step: {step_name}")
-    exit_code = os.system(command)
-    if exit_code != 0:
-        logger.error(f"Step failed: {step_name}")
-        sys.exit(exit_code)
-    logger.info(f"Step completed: {step_name}")
+# Artifacts exchanged between stages (paths relative to the project root)
+CRIME_RAW_CSV = "DC_Crime_Incidents_in_2025.csv"
+CRIME_WITH_ZIP_CSV = "DC_Crime_Incidents_in_2025_with_zipcode.csv"
+ZILLOW_CSV = "dc_zillow_2025_09_30.csv"
+COMBINED_JSON = "dc_crime_zillow_combined.json"
+FRONTEND_JSON = "frontend_data.json"
+SHARD_DIR = "shards"
+SHARD_INDEX = os.path.join(SHARD_DIR, "index.json")
+TILE_DIR = "tiles"
+TILE_META = os.path.join(TILE_DIR, "tileset.json")
+KNOWLEDGE_PDF = "Checkpoint_Chang_Li.pdf"
+# Logical artifact (not a file): the crimes table after a load
+CRIMES_TABLE = "supabase:crimes"
+
+
+class StageFailed(Exception):
+    """Raised when a stage function does not return True (every stage reports an explicit bool)"""
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[[], Any]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # "ok", "failed" or "skipped"
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def resolve_dependencies(stages: List[Stage]) -> Dict[str, List[str]]:
+    """
+    Map each stage name to the names of the stages producing its inputs.
+    Inputs nobody produces must already exist on disk when the stage starts.
+    """
+    producers = {}
+    for stage in stages:
+        for output in stage.outputs:
+            if output in producers:
+                raise ValueError(f"Artifact {output} produced by both {producers[output]} and {stage.name}")
+            producers[output] = stage.name
+
+    return {
+        stage.name: sorted({producers[i] for i in stage.inputs if i in producers and producers[i] != stage.name})
+        for stage in stages
+    }
+
+
+def run_stage(stage: Stage, produced: set) -> StageResult:
+    """Run one stage, timing it and turning any error into a failed result"""
+    start = time.perf_counter()
+    try:
+        missing = [i for i in stage.inputs if i not in produced and not os.path.exists(i)]
+        if missing:
+            raise FileNotFoundError(f"Missing inputs: {', '.join(missing)}")
+
+        if not stage.func():
+            raise StageFailed(f"{stage.name} reported failure")
+
+        return StageResult(stage.name, "ok", time.perf_counter() - start)
+    except Exception as e:
+        return StageResult(stage.name, "failed", time.perf_counter() - start, str(e))
+
+
+def run_dag(stages: List[Stage], max_workers: int = 3) -> Dict[str, StageResult]:
+    """
+    Execute stages in dependency order with at most max_workers running at once.
+    Returns a result per stage; stages downstream of a failure are skipped.
+    """
+    deps = resolve_dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    pending = dict(deps)
+    results: Dict[str, StageResult] = {}
+    produced = set()
+
+    def skip_downstream(failed_name):
+        for name, stage_deps in list(pending.items()):
+            if failed_name in stage_deps:
+                del pending[name]
+                results[name] = StageResult(name, "skipped", error=f"upstream stage {failed_name} did not succeed")
+                logger.warning(f"Skipping step: {name} (upstream {failed_name} did not succeed)")
+                skip_downstream(name)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stage") as pool:
+        running = {}
+        while pending or running:
+            ready = [name for name, stage_deps in pending.items() if all(d in results for d in stage_deps)]
+            for name in ready:
+                del pending[name]
+                logger.info(f"Starting step: {name}")
+                running[pool.submit(run_stage, by_name[name], frozenset(produced))] = name
+
+            if not running:
+                # Remaining stages wait on something that never ran (dependency cycle)
+                for name in pending:
+                    results[name] = StageResult(name, "skipped", error="dependency cycle")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result = future.result()
+                results[name] = result
+                if result.status == "ok":
+                    produced.update(by_name[name].outputs)
+                    logger.info(f"Step completed: {name} ({result.seconds:.2f}s)")
+                else:
+                    logger.error(f"Step failed: {name} ({result.seconds:.2f}s): {result.error}")
+                    skip_downstream(name)
+
+    return results
+
+
+# --- Stage functions (imported lazily so an unused stage never pays its import cost) ---
+
+def stage_add_zipcodes():
+    from scripts.add_zipcode_to_crime_data import add_zipcode_to_crime_data
+    return not add_zipcode_to_crime_data(CRIME_RAW_CSV, CRIME_WITH_ZIP_CSV).empty
+
+
+def stage_export_json():
+    from scripts.process_data import process_data
+    return process_data(CRIME_WITH_ZIP_CSV, ZILLOW_CSV, output=COMBINED_JSON, frontend_output=FRONTEND_JSON)
+
+
+def stage_build_shards():
+    from scripts.build_shards import build_shards
+    return build_shards(COMBINED_JSON, SHARD_DIR) is not None
+
+
+def stage_build_tiles():
+    from scripts.build_tiles import build_tiles
+    return build_tiles(CRIME_WITH_ZIP_CSV, TILE_DIR) is not None
+
+
+def stage_upload_supabase(loader=None, full=False):
+    from scripts.upload_to_supabase import upload_to_supabase, upload_zillow_to_supabase
+    crimes_ok = upload_to_supabase(crime_csv=CRIME_WITH_ZIP_CSV, loader=loader, full=full, refresh=False)
+    zillow_ok = upload_zillow_to_supabase(loader=loader, refresh=False)
+    return crimes_ok and zillow_ok
+
+
+def stage_refresh_aggregates(loader=None):
+    from scripts.refresh_aggregates import refresh_crime_aggregates
+    return refresh_crime_aggregates(loader)
+
+
+def stage_upload_stats():
+    from scripts.upload_stats import upload_stats
+    return upload_stats()
+
+
+def stage_upload_gcs():
+    from scripts.upload_to_gcp_storage import upload_to_gcp_storage
+    return upload_to_gcp_storage(FRONTEND_JSON,
+                                 shard_dir=SHARD_DIR if os.path.exists(SHARD_INDEX) else None,
+                                 tile_dir=TILE_DIR if os.path.exists(TILE_META) else None)
+
+
+def stage_upload_knowledge():
+    from scripts.upload_knowledge import upload_knowledge
+    return upload_knowledge()
+
+
+def build_stages(args) -> List[Stage]:
+    stages = []
+
+    # 1. Process Crime Data (Add Zipcodes)
+    if not args.skip_ingest:
+        stages.append(Stage("add_zipcodes", stage_add_zipcodes,
+                            inputs=[CRIME_RAW_CSV], outputs=[CRIME_WITH_ZIP_CSV]))
+
+    # 2. Export JSON (Optional, for backward compatibility)
+    if args.export_json:
+        stages.append(Stage("export_json", stage_export_json,
+                            inputs=[CRIME_WITH_ZIP_CSV, ZILLOW_CSV], outputs=[COMBINED_JSON, FRONTEND_JSON]))
+        stages.append(Stage("build_shards", stage_build_shards,
+                            inputs=[COMBINED_JSON], outputs=[SHARD_INDEX]))
+        stages.append(Stage("build_tiles", stage_build_tiles,
+                            inputs=[CRIME_WITH_ZIP_CSV], outputs=[TILE_META]))
+
+    # 3. Uploads (independent of each other, run concurrently)
+    if not args.skip_upload:
+        stages.append(Stage("upload_supabase", lambda: stage_upload_supabase(args.loader, args.full_upload),
+                            inputs=[CRIME_WITH_ZIP_CSV, ZILLOW_CSV], outputs=[CRIMES_TABLE]))
+        stages.append(Stage("refresh_aggregates", lambda: stage_refresh_aggregates(args.loader),
+                            inputs=[CRIMES_TABLE]))
+        if args.upload_stats:
+            stages.append(Stage("upload_stats", stage_upload_stats,
+                                inputs=[FRONTEND_JSON]))
+        if args.upload_gcs:
+            stages.append(Stage("upload_gcs", stage_upload_gcs,
+                                inputs=[FRONTEND_JSON] + ([SHARD_INDEX, TILE_META] if args.export_json else [])))
+        if args.upload_knowledge:
+            stages.append(Stage("upload_knowledge", stage_upload_knowledge,
+                                inputs=[KNOWLEDGE_PDF]))
+
+    return stages
+
 
 def main():
     parser = argparse.ArgumentParser(description="DC Crime & Zillow Data Pipeline")
     parser.add_argument("--skip-ingest", action="store_true", help="Skip data ingestion/processing")
     parser.add_argument("--skip-upload", action="store_true", help="Skip uploading to Supabase")
     parser.add_argument("--export-json", action="store_true", help="Export JSON after processing")
+    parser.add_argument("--upload-gcs", action="store_true", help="Also publish frontend_data.json, the ZIP shards and map tiles to GCP Storage")
+    parser.add_argument("--upload-stats", action="store_true", help="Also upsert frontend_data.json indices into zipcode_stats")
+    parser.add_argument("--upload-knowledge", action="store_true", help="Also rebuild the paper knowledge base")
+    parser.add_argument("--loader", choices=["rest", "copy"], default=None,
+                        help="Supabase upload path: PostgREST upserts or COPY over DATABASE_URL (default: $UPLOAD_LOADER or rest)")
+    parser.add_argument("--full-upload", action="store_true", help="Re-upload every crime row instead of only the delta")
+    parser.add_argument("--max-workers", type=int, default=3, help="Maximum number of stages running at once")
     args = parser.parse_args()
 
+    load_dotenv()
+    if not os.getenv('SUPABASE_URL'):
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env'))
+
     logger.info("Starting Data Pipeline")
+    start = time.perf_counter()
 
-    # 1. Process Crime Data (Add Zipcodes)
-    if not args.skip_ingest:
-        # Assuming the input file is standard, or we could make this configurable
-        # For now, we use the existing script's default or pass arguments if needed
-        # We need to ensure the input file exists. 
-        # In a real scenario, we might scan for new CSVs.
-        # For this MVP, we'll run the existing script.
-        run_step("Add Zipcodes to Crime Data", f"{sys.executable} scripts/add_zipcode_to_crime_data.py")
-
-    # 2. Upload to Supabase
-    if not args.skip_upload:
-        run_step("Upload to Supabase", f"{sys.executable} scripts/upload_to_supabase.py")
+    stages = build_stages(args)
+    results = run_dag(stages, max_workers=max(1, args.max_workers))
 
-    # 3. Export JSON (Optional, for backward compatibility)
-    if args.export_json:
-        run_step("Export JSON", f"{sys.executable} scripts/combine_data_to_json.py")
+    logger.info("Stage summary:")
+    for stage in stages:
+        result = results[stage.name]
+        detail = f" - {result.error}" if result.error else ""
+        logger.info(f"  {stage.name:<18} {result.status:<8} {result.seconds:8.2f}s{detail}")
+    logger.info(f"Total wall time: {time.perf_counter() - start:.2f}s")
+
+    failed = [r.name for r in results.values() if r.status != "ok"]
+    if failed:
+        logger.error(f"Pipeline finished with failures: {', '.join(failed)}")
+        sys.exit(1)
 
     logger.info("Pipeline completed successfully!")
 
@@ -16,6 +16,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from scripts.lib import hci, indices, loader
 
+# Number of most recent incidents kept per ZIP in the combined JSON
+RECENT_CRIMES_PER_ZIP = 10
+
 def load_crime_data(file_path: str) -> pd.DataFrame:
     print(f"Loading Crime Data: {file_path}")
     if not os.path.exists(file_path):
@@ -65,18 +68,18 @@ def process_zillow_data(zillow_df: pd.DataFrame) -> Dict[str, Dict]:
         
     return zillow_data
 
-def main():
-    parser = argparse.ArgumentParser(description="Process DC Crime & Zillow Data")
-    parser.add_argument("--crime-csv", default="DC_Crime_Incidents_in_2025_with_zipcode.csv", help="Path to Crime CSV")
-    parser.add_argument("--zillow-csv", default="dc_zillow_2025_09_30.csv", help="Path to Zillow CSV")
-    parser.add_argument("--housets-census-csv", default="HouseTS.csv", help="Path to HouseTS CSV")
-    parser.add_argument("--output", default="dc_crime_zillow_combined.json", help="Output JSON file")
-    parser.add_argument("--frontend-output", default="frontend_data.json", help="Frontend JSON file")
-    args = parser.parse_args()
-
+def process_data(crime_csv: str = "DC_Crime_Incidents_in_2025_with_zipcode.csv",
+                 zillow_csv: str = "dc_zillow_2025_09_30.csv",
+                 housets_census_csv: str = "HouseTS.csv",
+                 output: str = "dc_crime_zillow_combined.json",
+                 frontend_output: str = "frontend_data.json") -> bool:
+    """
+    Build the combined JSON (stats, indices, HCI and recent crimes per ZIP) and
+    the frontend JSON. Returns False when there is no usable crime data.
+    """
     # 1. Load Data
-    crime_df = load_crime_data(args.crime_csv)
-    zillow_raw_df = load_zillow_data(args.zillow_csv)
+    crime_df = load_crime_data(crime_csv)
+    zillow_raw_df = load_zillow_data(zillow_csv)
     
     # Load HouseTS and extract Census
     dc_zip_codes = None
@@ -86,8 +89,11 @@ def main():
         crime_df = crime_df.dropna(subset=['ZIP_CODE'])
         crime_df['ZIP_CODE'] = crime_df['ZIP_CODE'].astype(int).astype(str)
         dc_zip_codes = crime_df['ZIP_CODE'].unique().tolist()
+    if not dc_zip_codes:
+        print(f"Error: no crime rows with ZIP_CODE in {crime_csv}")
+        return False
     
-    housets_df = loader.load_housets_csv(args.housets_census_csv, dc_zip_codes=dc_zip_codes)
+    housets_df = loader.load_housets_csv(housets_census_csv, dc_zip_codes=dc_zip_codes)
     census_data = loader.extract_latest_census_data(housets_df)
     
     # Fallback for missing census data (e.g., 20024)
@@ -124,7 +130,11 @@ def main():
     # Crime Stats Aggregation
     print("Aggregating Crime Stats...")
     crime_stats = {}
+    recent_crimes = {}
     if not crime_df.empty:
+        # Parse report timestamps once so each ZIP can keep its most recent incidents
+        crime_df['_REPORT_TS'] = pd.to_datetime(crime_df['REPORT_DAT'], errors='coerce', utc=True)
+
         # Group by ZIP_CODE
         grouped = crime_df.groupby('ZIP_CODE')
         
@@ -152,6 +162,22 @@ def main():
                 'by_ward': by_ward
             }
 
+            # Most recent incidents (served by the backend snapshot)
+            recent = group.dropna(subset=['_REPORT_TS']).nlargest(RECENT_CRIMES_PER_ZIP, '_REPORT_TS')
+            # Missing text is NaN, which json.dump writes as bare NaN (invalid JSON); emit null instead
+            fields = recent[['OFFENSE', 'BLOCK', 'SHIFT', 'METHOD']].astype(object)
+            fields = fields.where(fields.notna(), None)
+            recent_crimes[zip_str] = [
+                {
+                    'offense': row['OFFENSE'],
+                    'report_dat': ts.isoformat(),
+                    'block': row['BLOCK'],
+                    'shift': row['SHIFT'],
+                    'method': row['METHOD']
+                }
+                for ts, row in zip(recent['_REPORT_TS'], fields.to_dict('records'))
+            ]
+
     # 3. Calculate Statistics for Normalization
     # Collect all values to find min/max/percentiles
     crime_values = [s['total_crimes'] for s in crime_stats.values()]
@@ -253,6 +279,7 @@ def main():
             'census_data': cen_data,
             'crime_stats': c_stats,
             'indices': legacy_indices,
+            'recent_crimes': recent_crimes.get(zip_code, []),
             'hci': {
                 'default': hci_result,
                 'ranges': {
@@ -303,15 +330,34 @@ def main():
         'data': combined_data
     }
     
-    with open(args.output, 'w') as f:
+    with open(output, 'w') as f:
         json.dump(output_data, f, indent=2, default=str)
-    print(f"\nSaved combined data to {args.output}")
+    print(f"\nSaved combined data to {output}")
     
-    # 6. Generate Frontend Data (Matching structure)
+    # 6. Generate Frontend Data (Matching structure, without backend-only fields)
     print("Generating Frontend Data...")
-    with open(args.frontend_output, 'w') as f:
-        json.dump(output_data, f, indent=2, default=str)
-    print(f"Saved frontend data to {args.frontend_output}")
+    frontend_data = {
+        'metadata': output_data['metadata'],
+        'data': {
+            zip_code: {k: v for k, v in info.items() if k != 'recent_crimes'}
+            for zip_code, info in combined_data.items()
+        }
+    }
+    with open(frontend_output, 'w') as f:
+        json.dump(frontend_data, f, indent=2, default=str)
+    print(f"Saved frontend data to {frontend_output}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Process DC Crime & Zillow Data")
+    parser.add_argument("--crime-csv", default="DC_Crime_Incidents_in_2025_with_zipcode.csv", help="Path to Crime CSV")
+    parser.add_argument("--zillow-csv", default="dc_zillow_2025_09_30.csv", help="Path to Zillow CSV")
+    parser.add_argument("--housets-census-csv", default="HouseTS.csv", help="Path to HouseTS CSV")
+    parser.add_argument("--output", default="dc_crime_zillow_combined.json", help="Output JSON file")
+    parser.add_argument("--frontend-output", default="frontend_data.json", help="Frontend JSON file")
+    args = parser.parse_args()
+    return process_data(args.crime_csv, args.zillow_csv, args.housets_census_csv,
+                        args.output, args.frontend_output)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Refresh the server-side crime aggregates after a crime load.
+
+Runs refresh_zipcode_aggregates() (see backend/schema.sql), which regroups
+only the ZIPs whose crimes changed since the last refresh into the per-ZIP
+totals, offense, shift and monthly tables, then refresh_stats_summary().
+Uses PostgREST RPC by default, or the direct Postgres connection when the
+COPY loader is selected.
+"""
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.lib import pg_copy
+from scripts.upload_to_supabase import CRIME_AGGREGATE_FUNCTIONS
+
+
+def refresh_crime_aggregates(loader=None):
+    load_dotenv()
+    if not os.getenv('SUPABASE_URL'):
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend', '.env'))
+    loader = loader or os.getenv('UPLOAD_LOADER', 'rest')
+
+    start = time.perf_counter()
+    if loader == 'copy':
+        with pg_copy.connect() as conn:
+            results = {name: conn.execute(f"select {name}()").fetchone()[0] for name in CRIME_AGGREGATE_FUNCTIONS}
+    else:
+        url = os.getenv('SUPABASE_URL')
+        key = os.getenv('SUPABASE_KEY')
+        if not url or not key:
+            print("Error: Supabase credentials not found.")
+            return False
+        supabase = create_client(url, key)
+        results = {name: supabase.rpc(name).execute().data for name in CRIME_AGGREGATE_FUNCTIONS}
+
+    refreshed = results.get('refresh_zipcode_aggregates')
+    print(f"✅ Refreshed crime aggregates for {refreshed or 0} ZIPs in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+if __name__ == "__main__":
+    refresh_crime_aggregates()
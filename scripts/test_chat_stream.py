@@ -0,0 +1,48 @@
+import json
+import time
+import requests
+
+def test_chat_stream():
+    """
+    Stream /api/chat/stream and print each SSE event with its arrival time.
+    Run the backend with CHAT_MODEL_BACKEND=fake to test without Gemini.
+    """
+    url = "http://localhost:8000/api/chat/stream"
+
+    payload = {
+        "query": "Is 20001 a safe place to buy a house?",
+        "history": [],
+        "client_context": {"current_zip": "20001"}
+    }
+
+    try:
+        print(f"Sending query: {payload['query']}")
+        start = time.perf_counter()
+        first_token = None
+
+        with requests.post(url, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                print(f"\n❌ Error {response.status_code}: {response.text}")
+                return
+
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    elapsed = (time.perf_counter() - start) * 1000
+                    data = json.loads(line[len("data: "):])
+                    if event == "token" and first_token is None:
+                        first_token = elapsed
+                    print(f"[{elapsed:8.1f} ms] {event}: {data}")
+
+        total = (time.perf_counter() - start) * 1000
+        print(f"\n✅ Time to first token: {first_token:.1f} ms" if first_token else "\n⚠️ No tokens received")
+        print(f"   Total time: {total:.1f} ms")
+
+    except Exception as e:
+        print(f"\n❌ Connection failed: {e}")
+        print("Make sure the backend is running (python3 main.py)")
+
+if __name__ == "__main__":
+    test_chat_stream()
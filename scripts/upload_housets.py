@@ -1,29 +1,14 @@
 import pandas as pd
 import os
+import sys
 from supabase import create_client, Client
 from dotenv import load_dotenv
-import numpy as np
 
-def upload_housets():
-    # Load env
-    load_dotenv()
-    if not os.getenv('SUPABASE_URL'):
-        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'backend', '.env'))
-        
-    url = os.getenv('SUPABASE_URL')
-    key = os.getenv('SUPABASE_KEY')
-    
-    if not url or not key:
-        print("Error: Supabase credentials not found.")
-        return
-
-    supabase: Client = create_client(url, key)
-    
-    input_file = 'HouseTS.csv'
-    if not os.path.exists(input_file):
-        print(f"Error: {input_file} not found.")
-        return
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.lib import pg_copy, batch_upload
+from scripts.lib.records import JsonColumns
 
+def prepare_housets_frame(input_file='HouseTS.csv'):
     print("Reading HouseTS.csv...")
     # Read only necessary columns to save memory if file is huge
     # Based on grep, columns are: date, median_sale_price, ..., city, zipcode, ...
@@ -51,49 +36,83 @@ def upload_housets():
         'median_dom', 'avg_sale_to_list', 'sold_above_list', 'zip_code'
     ]
     
-    # Convert types
+    # Convert types (missing values stay NaN and are sent as NULL)
     df_upload['zip_code'] = df_upload['zip_code'].astype(str)
-    df_upload = df_upload.replace({np.nan: None})
-    
-    records = df_upload.to_dict('records')
+
+    return df_upload
+
+def upload_housets(loader=None):
+    """
+    loader: 'rest' (PostgREST JSON upsert) or 'copy' (COPY + merge over DATABASE_URL)
+    """
+    # Load env
+    load_dotenv()
+    if not os.getenv('SUPABASE_URL'):
+        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'backend', '.env'))
+    loader = loader or os.getenv('UPLOAD_LOADER', 'rest')
+
+    input_file = 'HouseTS.csv'
+    if not os.path.exists(input_file):
+        print(f"Error: {input_file} not found.")
+        return
+
+    if loader == 'copy':
+        df_upload = prepare_housets_frame(input_file)
+        print(f"COPY {len(df_upload)} records into 'house_ts'...")
+        stats = pg_copy.copy_merge(df_upload, 'house_ts', ['zip_code', 'date'])
+        print(f"✅ Upload successful! {stats} via COPY")
+        return
+
+    url = os.getenv('SUPABASE_URL')
+    key = os.getenv('SUPABASE_KEY')
+
+    if not url or not key:
+        print("Error: Supabase credentials not found.")
+        return
+
+    supabase: Client = create_client(url, key)
+
+    records = JsonColumns(prepare_housets_frame(input_file))
     
     print(f"Uploading {len(records)} records to 'house_ts'...")
-    
-    batch_size = 1000
-    total_uploaded = 0
-    
-    for i in range(0, len(records), batch_size):
-        batch = records[i:i+batch_size]
-        try:
-            supabase.table('house_ts').upsert(batch).execute()
-            total_uploaded += len(batch)
-            print(f"   Uploaded: {total_uploaded}/{len(records)}")
-        except Exception as e:
-            print(f"   ⚠️ Batch failed: {e}")
-            print("\nMake sure you have updated the table in Supabase with this SQL:")
-            print("""
-            -- You may need to drop the old table first: DROP TABLE house_ts;
-            create table house_ts (
-              id bigint generated by default as identity primary key,
-              zip_code text,
-              date date,
-              median_sale_price float,
-              median_list_price float,
-              median_ppsf float,
-              homes_sold float,
-              pending_sales float,
-              new_listings float,
-              inventory float,
-              median_dom float,
-              avg_sale_to_list float,
-              sold_above_list float,
-              created_at timestamp with time zone default timezone('utc'::text, now())
-            );
-            alter table house_ts add constraint house_ts_zip_date_key unique (zip_code, date);
-            """)
-            return
 
-    print("✅ Upload successful!")
+    result = batch_upload.upload_batches(
+        records,
+        batch_upload.postgrest_upsert(supabase, 'house_ts', 'zip_code,date'),
+        label='house_ts',
+        workers=int(os.getenv('UPLOAD_WORKERS', '4'))
+    )
+
+    if result.aborted:
+        print(f"❌ Upload aborted: {result}")
+        return
+
+    if result.failed:
+        print(f"⚠️ {result}")
+        print("\nIf every row failed, make sure you have updated the table in Supabase with this SQL:")
+        print("""
+        -- You may need to drop the old table first: DROP TABLE house_ts;
+        create table house_ts (
+          id bigint generated by default as identity primary key,
+          zip_code text,
+          date date,
+          median_sale_price float,
+          median_list_price float,
+          median_ppsf float,
+          homes_sold float,
+          pending_sales float,
+          new_listings float,
+          inventory float,
+          median_dom float,
+          avg_sale_to_list float,
+          sold_above_list float,
+          created_at timestamp with time zone default timezone('utc'::text, now())
+        );
+        alter table house_ts add constraint house_ts_zip_date_key unique (zip_code, date);
+        """)
+        return
+
+    print(f"✅ Upload successful! {result} via PostgREST")
 
 if __name__ == "__main__":
     upload_housets()
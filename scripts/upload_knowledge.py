@@ -1,33 +1,87 @@
+"""
+Build the RAG knowledge base from the research paper.
+
+The PDF is converted to Markdown by Gemini once per PDF content hash (cached
+under .cache/knowledge/), split into sections by header, embedded in batches
+on a few concurrent workers under a requests-per-minute limit, and upserted
+into `documents` in bulk.
+
+Chunks are keyed by (source, content_hash). A re-run only embeds chunks whose
+hash is new, revives tombstoned chunks that reappear, and tombstones chunks
+that are gone, then bumps the source's version in `document_sources`. If the
+PDF hash matches the recorded version, nothing is done at all.
+"""
 import os
 import time
-import re
+import hashlib
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
 import google.generativeai as genai
 from supabase import create_client
 from dotenv import load_dotenv
 
-def upload_knowledge():
-    # Load env
-    load_dotenv("backend/.env")
-    
-    # Check keys
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    gemini_key = os.getenv("GEMINI_API_KEY")
-    
-    if not all([supabase_url, supabase_key, gemini_key]):
-        print("Error: Missing environment variables.")
-        return
+PDF_PATH = "Checkpoint_Chang_Li.pdf"
+CONVERSION_MODEL = "gemini-2.0-flash-exp"
+EMBEDDING_MODEL = "models/text-embedding-004"
+MARKDOWN_CACHE_DIR = os.path.join(".cache", "knowledge")
 
-    # Initialize clients
-    supabase = create_client(supabase_url, supabase_key)
-    genai.configure(api_key=gemini_key)
-    
-    pdf_path = "Checkpoint_Chang_Li.pdf"
-    if not os.path.exists(pdf_path):
-        print(f"Error: {pdf_path} not found.")
-        return
+EMBED_BATCH_SIZE = int(os.getenv("KNOWLEDGE_EMBED_BATCH_SIZE", "32"))
+EMBED_WORKERS = int(os.getenv("KNOWLEDGE_EMBED_WORKERS", "4"))
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("KNOWLEDGE_EMBED_RPM", "60"))
+EMBED_RETRIES = 3
+INSERT_BATCH_SIZE = 50
 
-    print(f"🚀 Starting Semantic Chunking for {pdf_path}...")
+CONVERSION_PROMPT = """
+    Please convert this academic paper into structured Markdown.
+
+    **Requirements:**
+    1.  **Headers:** Use standard Markdown headers (#, ##, ###) for all section titles (e.g., # Introduction, ## Related Work).
+    2.  **Tables:** Convert all tables into Markdown tables. Preserve all data.
+    3.  **Formulas:** Use LaTeX format for all math formulas (e.g., $HCI = ...$).
+    4.  **Content:** Preserve all text content accurately. Do not summarize.
+    5.  **Structure:** Ensure the logical flow is maintained.
+    """
+
+
+class RateLimiter:
+    """Spaces calls at least 60/requests_per_minute seconds apart, across threads"""
+
+    def __init__(self, requests_per_minute: int):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def convert_pdf_to_markdown(pdf_path: str, pdf_hash: str) -> str:
+    """Gemini PDF -> Markdown, cached by the PDF's content hash"""
+    cache_path = os.path.join(MARKDOWN_CACHE_DIR, f"{pdf_hash}.md")
+    if os.path.exists(cache_path):
+        print(f"Using cached Markdown for {pdf_path} ({cache_path})")
+        with open(cache_path, encoding="utf-8") as f:
+            return f.read()
 
     # 1. Upload PDF to Gemini
     print("Uploading PDF to Gemini...")
@@ -43,83 +97,194 @@ def upload_knowledge():
 
     # 2. Convert to Markdown
     print("Converting PDF to Structured Markdown...")
-    model = genai.GenerativeModel(model_name="gemini-2.0-flash-exp")
-    
-    prompt = """
-    Please convert this academic paper into structured Markdown.
-    
-    **Requirements:**
-    1.  **Headers:** Use standard Markdown headers (#, ##, ###) for all section titles (e.g., # Introduction, ## Related Work).
-    2.  **Tables:** Convert all tables into Markdown tables. Preserve all data.
-    3.  **Formulas:** Use LaTeX format for all math formulas (e.g., $HCI = ...$).
-    4.  **Content:** Preserve all text content accurately. Do not summarize.
-    5.  **Structure:** Ensure the logical flow is maintained.
-    """
-    
-    response = model.generate_content([sample_file, prompt])
+    model = genai.GenerativeModel(model_name=CONVERSION_MODEL)
+    response = model.generate_content([sample_file, CONVERSION_PROMPT])
     markdown_text = response.text
-    
-    # Save for debug
-    with open("paper_converted.md", "w") as f:
+
+    os.makedirs(MARKDOWN_CACHE_DIR, exist_ok=True)
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
         f.write(markdown_text)
-    print("Markdown saved to 'paper_converted.md'.")
+    os.replace(tmp_path, cache_path)
+    return markdown_text
 
-    # 3. Split by Headers (Simple Semantic Chunking)
-    print("Splitting content by headers...")
+
+def split_by_headers(markdown_text: str) -> List[Dict[str, str]]:
+    """Simple semantic chunking: level 1 (#) and level 2 (##) headers start a new chunk"""
     chunks = []
     current_chunk = {"title": "Start", "content": ""}
-    
-    lines = markdown_text.split('\n')
-    for line in lines:
-        # Check for headers (## or ###)
-        # We treat Level 1 (#) and Level 2 (##) as chunk boundaries
+
+    for line in markdown_text.split('\n'):
         if line.strip().startswith('# ') or line.strip().startswith('## '):
             # Save previous chunk if it has content
             if current_chunk["content"].strip():
                 chunks.append(current_chunk)
-            
-            # Start new chunk
+
             current_chunk = {
                 "title": line.strip().lstrip('#').strip(),
                 "content": line + "\n"
             }
         else:
             current_chunk["content"] += line + "\n"
-            
+
     # Append last chunk
     if current_chunk["content"].strip():
         chunks.append(current_chunk)
 
-    print(f"Generated {len(chunks)} semantic chunks.")
+    return chunks
 
-    # 4. Embed and Upload
-    print("Generating embeddings and uploading to Supabase...")
-    
-    for i, chunk in enumerate(chunks):
+
+def embed_batch(texts: List[str], limiter: RateLimiter) -> List[List[float]]:
+    """One batched embed_content call, retried with backoff"""
+    for attempt in range(EMBED_RETRIES):
+        limiter.wait()
         try:
-            # Contextualize the chunk with its title
-            text_to_embed = f"Section: {chunk['title']}\n\n{chunk['content']}"
-            
             result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=text_to_embed,
+                model=EMBEDDING_MODEL,
+                content=texts,
                 task_type="retrieval_document"
             )
-            embedding = result['embedding']
-            
-            data = {
-                "content": text_to_embed,
-                "metadata": {"source": pdf_path, "section": chunk['title']},
-                "embedding": embedding
-            }
-            
-            supabase.table("documents").insert(data).execute()
-            print(f"Uploaded chunk {i+1}/{len(chunks)}: {chunk['title']}")
-            
+            embeddings = result['embedding']
+            if len(embeddings) != len(texts):
+                raise ValueError(f"expected {len(texts)} embeddings, got {len(embeddings)}")
+            return embeddings
         except Exception as e:
-            print(f"Error processing chunk {i+1}: {e}")
+            if attempt == EMBED_RETRIES - 1:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Embedding batch failed ({e}), retrying in {delay}s...")
+            time.sleep(delay)
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed in batches of EMBED_BATCH_SIZE on EMBED_WORKERS threads; keeps input order"""
+    limiter = RateLimiter(EMBED_REQUESTS_PER_MINUTE)
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        results = list(pool.map(lambda batch: embed_batch(batch, limiter), batches))
+    return [embedding for batch in results for embedding in batch]
+
+
+def load_source(supabase, source: str) -> Optional[Dict[str, Any]]:
+    response = supabase.table("document_sources").select("*").eq("source", source).limit(1).execute()
+    return response.data[0] if response.data else None
+
+
+def existing_chunks(supabase, source: str) -> Dict[str, Dict[str, Any]]:
+    """content_hash -> {id, deleted_at} for every stored chunk of this source, live or tombstoned"""
+    response = supabase.table("documents").select("id, content_hash, deleted_at").eq("source", source).execute()
+    return {row["content_hash"]: row for row in response.data or []}
+
+
+def upsert_documents(supabase, rows: List[Dict]):
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        batch = rows[start:start + INSERT_BATCH_SIZE]
+        supabase.table("documents").upsert(batch, on_conflict="source,content_hash").execute()
+        print(f"Upserted chunks {start + 1}-{start + len(batch)}/{len(rows)}")
+
+
+def mark_chunks(supabase, ids: List[int], values: Dict[str, Any]):
+    for start in range(0, len(ids), INSERT_BATCH_SIZE):
+        supabase.table("documents").update(values).in_("id", ids[start:start + INSERT_BATCH_SIZE]).execute()
+
+
+def upload_knowledge() -> bool:
+    # Load env
+    load_dotenv("backend/.env")
+
+    # Check keys
+    supabase_url = os.getenv("SUPABASE_URL")
+    supabase_key = os.getenv("SUPABASE_KEY")
+    gemini_key = os.getenv("GEMINI_API_KEY")
+
+    if not all([supabase_url, supabase_key, gemini_key]):
+        print("Error: Missing environment variables.")
+        return False
+
+    # Initialize clients
+    supabase = create_client(supabase_url, supabase_key)
+    genai.configure(api_key=gemini_key)
+
+    pdf_path = PDF_PATH
+    if not os.path.exists(pdf_path):
+        print(f"Error: {pdf_path} not found.")
+        return False
+
+    print(f"🚀 Starting Semantic Chunking for {pdf_path}...")
+    started = time.perf_counter()
+
+    pdf_hash = file_sha256(pdf_path)
+    source_row = load_source(supabase, pdf_path)
+    version = source_row["version"] if source_row else 0
+    if source_row and source_row.get("file_hash") == pdf_hash:
+        print(f"✅ Knowledge Base already up to date ({pdf_path} v{version})")
+        return True
+
+    markdown_text = convert_pdf_to_markdown(pdf_path, pdf_hash)
+
+    # Save for debug
+    with open("paper_converted.md", "w") as f:
+        f.write(markdown_text)
+    print("Markdown saved to 'paper_converted.md'.")
+
+    # 3. Split by Headers
+    print("Splitting content by headers...")
+    chunks = split_by_headers(markdown_text)
+    print(f"Generated {len(chunks)} semantic chunks.")
+
+    # 4. Diff against what is stored for this source
+    stored = existing_chunks(supabase, pdf_path)
+    current = {}
+    for chunk in chunks:
+        # Contextualize the chunk with its title
+        text_to_embed = f"Section: {chunk['title']}\n\n{chunk['content']}"
+        current.setdefault(content_hash(text_to_embed), (chunk, text_to_embed))
+
+    new_hashes = [h for h in current if h not in stored]
+    revived = [stored[h]["id"] for h in current if h in stored and stored[h]["deleted_at"]]
+    removed = [row["id"] for h, row in stored.items() if h not in current and not row["deleted_at"]]
+    print(f"{len(current) - len(new_hashes) - len(revived)} chunks unchanged, {len(new_hashes)} new, "
+          f"{len(revived)} revived, {len(removed)} removed.")
+
+    changed = bool(new_hashes or revived or removed)
+    next_version = version + 1 if changed else version
+
+    # 5. Embed and upsert only new chunks
+    if new_hashes:
+        print("Generating embeddings and uploading to Supabase...")
+        embeddings = embed_texts([current[h][1] for h in new_hashes])
+        rows = [
+            {
+                "content": current[h][1],
+                "metadata": {"source": pdf_path, "section": current[h][0]['title']},
+                "embedding": embedding,
+                "source": pdf_path,
+                "section": current[h][0]['title'],
+                "content_hash": h,
+                "source_version": next_version,
+                "deleted_at": None
+            }
+            for h, embedding in zip(new_hashes, embeddings)
+        ]
+        upsert_documents(supabase, rows)
+
+    if revived:
+        mark_chunks(supabase, revived, {"deleted_at": None, "source_version": next_version})
+    if removed:
+        mark_chunks(supabase, removed, {"deleted_at": datetime.now(timezone.utc).isoformat()})
+
+    # 6. Record the new source version last, so it only moves once the chunks are in place
+    supabase.table("document_sources").upsert({
+        "source": pdf_path,
+        "version": next_version,
+        "file_hash": pdf_hash,
+        "live_chunks": len(current),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }, on_conflict="source").execute()
 
-    print("✅ Knowledge Base Update Complete!")
+    print(f"✅ Knowledge Base Update Complete! ({pdf_path} v{next_version}, {len(current)} live chunks, "
+          f"{time.perf_counter() - started:.1f}s)")
+    return True
 
 if __name__ == "__main__":
     upload_knowledge()
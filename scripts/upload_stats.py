@@ -3,7 +3,7 @@ import os
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
-def upload_stats():
+def upload_stats() -> bool:
     # Load env
     load_dotenv()
     if not os.getenv('SUPABASE_URL'):
@@ -14,15 +14,15 @@ def upload_stats():
     
     if not url or not key:
         print("Error: Supabase credentials not found.")
-        return
+        return False
 
     supabase: Client = create_client(url, key)
     
     # Read frontend_data.json
     input_file = 'frontend_data.json'
     if not os.path.exists(input_file):
-        print(f"Error: {input_file} not found. Run extract_frontend_data.py first.")
-        return
+        print(f"Error: {input_file} not found. Run process_data.py first.")
+        return False
 
     with open(input_file, 'r') as f:
         data = json.load(f)
@@ -33,23 +33,17 @@ def upload_stats():
     for zip_code, info in data.get('data', {}).items():
         indices = info.get('indices', {})
         zillow = info.get('zillow_data', {}) or {}
-        crime = info.get('crime_stats', {})
-        
-        # Get top crime
-        top_crime = "N/A"
-        if crime.get('by_offense'):
-            top_crime = max(crime['by_offense'], key=crime['by_offense'].get)
 
+        # total_crimes / top_crime_type come from the server-side aggregates
+        # (sync_zipcode_stats below), not from the JSON export
         row = {
             'zip_code': zip_code,
-            'total_crimes': crime.get('total_crimes', 0),
             'avg_price': zillow.get('current_price'),
             'safety_index': indices.get('safety_index'),
             'affordability_index': indices.get('affordability_index'),
             'quality_of_life_index': indices.get('quality_of_life_index'),
             'investment_index': indices.get('investment_index'),
-            'crime_index': indices.get('crime_index'),
-            'top_crime_type': top_crime
+            'crime_index': indices.get('crime_index')
         }
         stats_list.append(row)
 
@@ -57,10 +51,12 @@ def upload_stats():
     
     try:
         data = supabase.table('zipcode_stats').upsert(stats_list).execute()
+        supabase.rpc('sync_zipcode_stats').execute()
         print("✅ Upload successful!")
+        return True
     except Exception as e:
         print(f"❌ Upload failed: {e}")
-        print("\nMake sure you have created the table in Supabase with this SQL:")
+        print("\nMake sure you have run backend/schema.sql (zipcode_stats, sync_zipcode_stats) or created the table with this SQL:")
         print("""
         create table zipcode_stats (
           zip_code text primary key,
@@ -75,6 +71,7 @@ def upload_stats():
           updated_at timestamp with time zone default timezone('utc'::text, now())
         );
         """)
+        return False
 
 if __name__ == "__main__":
     upload_stats()
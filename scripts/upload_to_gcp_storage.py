@@ -3,31 +3,94 @@
 上傳 JSON 檔案到 GCP Cloud Storage
 對應任務: AS-6 - Store json file into GCP cloud storage
 """
-import os
-from google.cloud import storage
-from google.oauth2 import service_account
 import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.lib import gcs_publish
+
+DEFAULT_BUCKET = 'dc-crime-data-zhangxuanqi-1762814591'
+BLOB_PREFIX = 'data/'
+SHARD_PREFIX = BLOB_PREFIX + 'shards/'
+TILE_PREFIX = BLOB_PREFIX + 'tiles/'
+
+
+def shard_artifacts(shard_dir):
+    """Per-ZIP shards from build_shards.py; their names are already content-hashed"""
+    zip_dir = os.path.join(shard_dir, 'zip')
+    return [
+        gcs_publish.Artifact(os.path.join(zip_dir, name), f"{SHARD_PREFIX}zip/{name}",
+                             cache_control=gcs_publish.IMMUTABLE_CACHE_CONTROL)
+        for name in sorted(os.listdir(zip_dir)) if name.endswith('.json')
+    ]
+
+
+def tile_artifacts(tile_dir):
+    """
+    Heat-map tiles from build_tiles.py under data/tiles/<version>/z/x/y.json:
+    the version (a hash of all tiles) keeps each tile set immutable.
+    Returns (prefix, artifacts).
+    """
+    from scripts.build_tiles import TILESET_NAME, tile_files
+    with open(os.path.join(tile_dir, TILESET_NAME), encoding='utf-8') as f:
+        version = json.load(f)['version']
+    prefix = f"{TILE_PREFIX}{version}/"
+    return prefix, [
+        gcs_publish.Artifact(os.path.join(tile_dir, rel), prefix + rel,
+                             cache_control=gcs_publish.IMMUTABLE_CACHE_CONTROL)
+        for rel in tile_files(tile_dir)
+    ]
+
 
 def upload_to_gcp_storage(
     json_file_path='frontend_data.json',
-    bucket_name='dc-crime-data-zhangxuanqi-1762814591',
-    credentials_path=None
+    bucket_name=DEFAULT_BUCKET,
+    credentials_path=None,
+    extra_files=(),
+    workers=None,
+    force=False,
+    legacy_names=True,
+    shard_dir=None,
+    tile_dir=None
 ):
     """
     上傳 JSON 檔案到 GCP Cloud Storage
-    
+
+    檔案以 gzip 壓縮後上傳（Content-Encoding: gzip，瀏覽器取得時自動解壓），
+    並先比對遠端物件的 MD5 / CRC32C，內容未變更的檔案直接略過。
+    大檔案使用分段的 resumable upload，多個檔案同時上傳。
+
+    每個檔案以內容雜湊命名（data/frontend_data.<hash>.json，Cache-Control 一年、immutable），
+    全部上傳完成後才一次覆寫 data/manifest.json 指向新版本；前端先讀 manifest（no-cache）
+    再讀實際檔案，因此不會讀到新舊混合的資料，也不需要對大檔案停用快取。
+
     Args:
         json_file_path: 要上傳的 JSON 檔案路徑
         bucket_name: GCP Storage bucket 名稱
         credentials_path: GCP 服務帳號憑證檔案路徑（JSON）
+        extra_files: 其他一起上傳的檔案
+        workers: 同時上傳的檔案數（預設為環境變數 GCS_UPLOAD_WORKERS 或 4）
+        force: True 時即使內容未變更也重新上傳
+        legacy_names: 同時更新舊的固定檔名（data/<檔名>，no-cache）
+        shard_dir: build_shards.py 的輸出資料夾；index.json 列入 manifest，
+                   各 ZIP 的 shard 上傳到 data/shards/zip/（manifest 的 shards_prefix）
+        tile_dir: build_tiles.py 的輸出資料夾；tileset.json 列入 manifest，
+                  tile 上傳到 data/tiles/<version>/z/x/y.json（manifest 的 tiles_prefix）
     """
     print("=" * 70)
     print("上傳 JSON 檔案到 GCP Cloud Storage")
     print("=" * 70)
     
+    paths = [json_file_path, *extra_files]
+    if shard_dir:
+        paths.append(os.path.join(shard_dir, 'index.json'))
+    if tile_dir:
+        paths.append(os.path.join(tile_dir, 'tileset.json'))
     # 檢查檔案是否存在
-    if not os.path.exists(json_file_path):
-        print(f"❌ 錯誤: 找不到檔案 {json_file_path}")
+    missing = [p for p in paths if not os.path.exists(p)]
+    if missing:
+        print(f"❌ 錯誤: 找不到檔案 {', '.join(missing)}")
         return False
     
     # 設定 bucket 名稱（如果未提供，使用環境變數或提示）
@@ -40,43 +103,60 @@ def upload_to_gcp_storage(
         print("❌ 錯誤: 需要提供 bucket 名稱")
         return False
     
+    workers = workers or int(os.getenv('GCS_UPLOAD_WORKERS', '4'))
+
     try:
-        # 初始化 Storage 客戶端
-        if credentials_path:
-            credentials = service_account.Credentials.from_service_account_file(
-                credentials_path
-            )
-            storage_client = storage.Client(credentials=credentials)
-        else:
-            # 使用預設憑證（從環境變數或 gcloud 設定）
-            storage_client = storage.Client()
-        
-        # 取得 bucket
-        bucket = storage_client.bucket(bucket_name)
-        
-        # 上傳檔案
-        blob_name = f"data/{os.path.basename(json_file_path)}"
-        blob = bucket.blob(blob_name)
-        
+        bucket = gcs_publish.open_bucket(bucket_name, credentials_path)
+
         print(f"\n上傳檔案...")
-        print(f"  檔案: {json_file_path}")
         print(f"  Bucket: {bucket_name}")
-        print(f"  Blob: {blob_name}")
-        
-        blob.upload_from_filename(json_file_path)
-        
-        # 設定公開讀取權限（如果需要）
-        # blob.make_public()
-        
+        print(f"  檔案數: {len(paths)}（同時上傳 {workers} 個）")
+
+        # 1. shard 與 tile 先上傳（index / tileset 指向它們，必須在 manifest 切換前就位）
+        extra = {}
+        groups = []
+        if shard_dir:
+            groups.append(('shards', shard_artifacts(shard_dir)))
+            extra['shards_prefix'] = SHARD_PREFIX
+        if tile_dir:
+            tiles_prefix, tiles = tile_artifacts(tile_dir)
+            groups.append(('tiles', tiles))
+            extra['tiles_prefix'] = tiles_prefix
+        for label, group in groups:
+            published = gcs_publish.publish(bucket, group, workers=workers, force=force, progress=False)
+            print(f"\n   {label}: {published}")
+            if not published.ok:
+                print(f"❌ 部分 {label} 上傳失敗，manifest 未更新")
+                return False
+
+        # 2. 以內容雜湊命名的不可變檔案（可永久快取），全部成功後才切換 manifest.json
+        result, manifest = gcs_publish.publish_versioned(bucket, paths, prefix=BLOB_PREFIX,
+                                                         workers=workers, force=force, extra=extra or None)
+        print(f"\n   {result}")
+        if manifest is None:
+            print(f"❌ 部分檔案上傳失敗，manifest 未更新（前端仍使用上一個版本）")
+            return False
+        print(f"   manifest 版本: {manifest['version']}（上一版: {manifest.get('previous_version')}）")
+
+        # 3. 舊的固定檔名（no-cache），給尚未改讀 manifest 的前端
+        if legacy_names:
+            aliases = [gcs_publish.Artifact(path, BLOB_PREFIX + os.path.basename(path),
+                                            cache_control=gcs_publish.MANIFEST_CACHE_CONTROL)
+                       for path in paths]
+            legacy = gcs_publish.publish(bucket, aliases, workers=workers, force=force, progress=False)
+            if not legacy.ok:
+                print(f"⚠️  固定檔名上傳失敗: {legacy}")
+
         # 取得公開 URL
-        public_url = blob.public_url
-        gs_url = f"gs://{bucket_name}/{blob_name}"
-        
+        manifest_name = BLOB_PREFIX + gcs_publish.MANIFEST_NAME
+        manifest_url = bucket.blob(manifest_name).public_url
+        data_url = bucket.blob(manifest['files'][os.path.basename(json_file_path)]['path']).public_url
+
         print(f"\n✅ 上傳成功！")
-        print(f"   GS URL: {gs_url}")
-        print(f"   公開 URL: {public_url}")
-        print(f"\n前端可以使用以下方式存取:")
-        print(f"   fetch('{public_url}')")
+        print(f"   Manifest: gs://{bucket_name}/{manifest_name}")
+        print(f"   公開 URL: {data_url}")
+        print(f"\n前端可以使用以下方式存取（只有 manifest 需要重新驗證）:")
+        print(f"   fetch('{manifest_url}', {{cache: 'no-cache'}}) → manifest.files['{os.path.basename(json_file_path)}'].path")
         
         return True
         
@@ -110,14 +190,16 @@ def setup_gcp_instructions():
 
 5. 執行上傳:
    python upload_to_gcp_storage.py
+
+6. 本機測試（不連線 GCS）:
+   GCS_LOCAL_DIR=.cache/gcs python upload_to_gcp_storage.py
+   或使用 fake-gcs-server 模擬器: export STORAGE_EMULATOR_HOST=http://localhost:4443
     """)
 
 if __name__ == "__main__":
-    import sys
-    
     # 檢查參數
     json_file = sys.argv[1] if len(sys.argv) > 1 else 'frontend_data.json'
-    bucket_name = sys.argv[2] if len(sys.argv) > 2 else 'dc-crime-data-zhangxuanqi-1762814591'
+    bucket_name = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_BUCKET
     credentials_path = sys.argv[3] if len(sys.argv) > 3 else None
     
     if not os.path.exists(json_file):